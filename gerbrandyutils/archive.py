@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+
+##########################################################################
+# Copyright (C) 2009 - 2014 Huygens ING & Gerbrandy S.R.L.
+#
+# This file is part of bioport.
+#
+# bioport is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/gpl-3.0.html>.
+##########################################################################
+
+"""
+Tar archives of the files produced by import scripts.
+
+Supported compressions are:
+
+ - 'gz': gzip, single threaded (the default)
+ - 'pgz': gzip compressed in parallel by a pool of threads; the output
+   is made of independent gzip members, like "pigz --independent", and
+   can be read by any gzip reader
+ - 'bz2': bzip2, single threaded
+ - None: no compression
+"""
+
+__all__ = ["make_tarfile", "open_tarfile", "ParallelGzipFile",
+           "make_delta_tarfile", "rebuild_tarfile", "DELETED"]
+
+import os
+import struct
+import tarfile
+import zlib
+import json
+import hashlib
+import collections
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from cStringIO import StringIO
+
+from writer import atomic_write
+
+# name of the member of delta archives listing the deleted files
+DELETED = '.deleted'
+
+def _gzip_member(data, level):
+    # a complete gzip member (RFC 1952) holding 'data'
+    c = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    body = c.compress(data) + c.flush()
+    header = '\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+    trailer = struct.pack('<LL', zlib.crc32(data) & 0xffffffff,
+                          len(data) & 0xffffffff)
+    return header + body + trailer
+
+
+class ParallelGzipFile(object):
+    """A write-only file object which compresses data in blocks of
+    'blocksize' bytes by using a pool of 'threads' threads (zlib
+    releases the GIL while compressing) and writes them in order as
+    independent gzip members into 'filename' or 'fileobj'.
+    """
+
+    def __init__(self, filename=None, level=9, threads=None,
+                 blocksize=1 << 20, fileobj=None):
+        if fileobj is None:
+            fileobj = open(filename, 'wb')
+            self._own_fileobj = True
+        else:
+            self._own_fileobj = False
+        self.fileobj = fileobj
+        self.level = level
+        self.blocksize = blocksize
+        self.threads = threads or multiprocessing.cpu_count()
+        self.closed = False
+        self._pool = ThreadPool(self.threads)
+        self._pending = collections.deque()
+        self._buffer = []
+        self._buffered = 0
+        self._written = False
+        self._offset = 0
+
+    def tell(self):
+        """Return the number of uncompressed bytes written so far."""
+        return self._offset
+
+    def write(self, data):
+        self._offset += len(data)
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.blocksize:
+            self._submit()
+
+    def _submit(self):
+        data = ''.join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        self._pending.append(
+            self._pool.apply_async(_gzip_member, (data, self.level)))
+        self._written = True
+        # bound memory usage: don't get too far ahead of the writes
+        while len(self._pending) > self.threads * 2:
+            self.fileobj.write(self._pending.popleft().get())
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if self._buffer or not self._written:
+                self._submit()
+            while self._pending:
+                self.fileobj.write(self._pending.popleft().get())
+        finally:
+            self._pool.close()
+            self._pool.join()
+            if self._own_fileobj:
+                self.fileobj.close()
+
+
+def open_tarfile(out_fn, compression='gz', level=9, threads=None):
+    """Open 'out_fn' as a tar archive to be written with the given
+    'compression' (see module docstring).
+    'threads' is only used by 'pgz' and defaults to the number of CPUs.
+    """
+    if compression == 'gz':
+        return tarfile.open(out_fn, "w:gz", compresslevel=level)
+    elif compression == 'bz2':
+        return tarfile.open(out_fn, "w:bz2", compresslevel=level)
+    elif compression == 'pgz':
+        fileobj = ParallelGzipFile(out_fn, level, threads)
+        try:
+            tar = tarfile.open(mode="w", fileobj=fileobj)
+        except:
+            fileobj.close()
+            raise
+        tar._extfileobj = False  # closes fileobj, as tarfile.gzopen does
+        return tar
+    elif compression is None:
+        return tarfile.open(out_fn, "w")
+    raise ValueError("unknown compression %r" % compression)
+
+
+def _walk(in_dir, flatten):
+    # yield (path, arcname) of the files to be archived
+    if flatten:
+        for root, dirs, names in os.walk(in_dir):
+            for name in names:
+                yield os.path.join(root, name), name
+    else:
+        for root, dirs, names in os.walk(in_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                yield path, os.path.relpath(path, in_dir)
+
+
+def make_tarfile(in_dir, out_fn, flatten=False, compression='gz', level=9,
+                 threads=None):
+    """Compress the content of 'in_dir' into 'out_fn'.
+    If 'flatten' is True files in subdirectories are added to the
+    archive by their name only (used with sharded output dirs).
+    See open_tarfile() for the other arguments.
+    """
+    tar = open_tarfile(out_fn, compression, level, threads)
+    try:
+        if flatten:
+            for path, name in _walk(in_dir, flatten):
+                tar.add(path, arcname=name)
+        else:
+            for name in os.listdir(in_dir):
+                tar.add(os.path.join(in_dir,  name), arcname=name)
+    finally:
+        tar.close()
+
+
+def _sha1(path):
+    h = hashlib.sha1()
+    f = open(path, 'rb')
+    try:
+        for chunk in iter(lambda: f.read(1 << 16), ''):
+            h.update(chunk)
+    finally:
+        f.close()
+    return h.hexdigest()
+
+
+def _read_manifest(manifest_fn):
+    manifest = {}
+    if os.path.exists(manifest_fn):
+        f = open(manifest_fn)
+        try:
+            for line in f:
+                entry = json.loads(line)
+                manifest[entry['path']] = entry
+        finally:
+            f.close()
+    return manifest
+
+
+def make_delta_tarfile(in_dir, out_fn, manifest_fn, flatten=False,
+                       compression='gz', level=9, threads=None):
+    """Archive into 'out_fn' only the files of 'in_dir' which were
+    added or changed since the state recorded in 'manifest_fn', plus a
+    DELETED member listing the files which are gone; the manifest
+    (path, size, mtime and sha1 of each file) is then updated.
+    Files whose size and mtime did not change are not even read; the
+    others are compared by content. Without a manifest all the files
+    are archived, so the first delta is a full archive which can be
+    used as base by rebuild_tarfile().
+    Return the (changed, deleted) lists of archive member names.
+    See make_tarfile() for the other arguments.
+    """
+    old = _read_manifest(manifest_fn)
+    new = {}
+    changed = []
+    tar = open_tarfile(out_fn, compression, level, threads)
+    try:
+        files = sorted(_walk(in_dir, flatten), key=lambda x: x[1])
+        deleted = sorted(set(old) - set(name for path, name in files))
+        if deleted:
+            data = "\n".join(deleted)
+            info = tarfile.TarInfo(DELETED)
+            info.size = len(data)
+            tar.addfile(info, StringIO(data))
+        for path, name in files:
+            st = os.stat(path)
+            entry = old.get(name)
+            if entry is None or entry['size'] != st.st_size or \
+                    entry['mtime'] != st.st_mtime:
+                sha1 = _sha1(path)
+                if entry is None or entry['sha1'] != sha1:
+                    tar.add(path, arcname=name)
+                    changed.append(name)
+                entry = dict(path=name, size=st.st_size, mtime=st.st_mtime,
+                             sha1=sha1)
+            new[name] = entry
+    finally:
+        tar.close()
+    atomic_write(manifest_fn, "".join(json.dumps(new[name]) + "\n"
+                                      for name in sorted(new)))
+    return changed, deleted
+
+
+def rebuild_tarfile(base_fn, delta_fns, out_fn, compression='gz', level=9,
+                    threads=None):
+    """Rebuild into 'out_fn' the full archive resulting from applying
+    the archives created by make_delta_tarfile() listed in 'delta_fns'
+    (oldest first) to the archive 'base_fn'.
+    Members are copied as they are streamed from the source archives.
+    """
+    archives = [base_fn] + list(delta_fns)
+    # member name -> index of the archive holding its latest version
+    # (None if deleted); base members are not listed
+    latest = {}
+    for i, fn in enumerate(archives):
+        if i == 0:
+            continue
+        tar = tarfile.open(fn)
+        try:
+            for member in tar:
+                if member.name == DELETED:
+                    for name in tar.extractfile(member).read().splitlines():
+                        latest[name] = None
+                else:
+                    latest[member.name] = i
+        finally:
+            tar.close()
+    out = open_tarfile(out_fn, compression, level, threads)
+    try:
+        for i, fn in enumerate(archives):
+            tar = tarfile.open(fn)
+            try:
+                for member in tar:
+                    if member.name == DELETED or \
+                            latest.get(member.name, 0) != i:
+                        continue
+                    if member.isfile():
+                        out.addfile(member, tar.extractfile(member))
+                    else:
+                        out.addfile(member)
+            finally:
+                tar.close()
+    finally:
+        out.close()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+##########################################################################
+# Copyright (C) 2009 - 2014 Huygens ING & Gerbrandy S.R.L.
+#
+# This file is part of bioport.
+#
+# bioport is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/gpl-3.0.html>.
+##########################################################################
+
+"""
+Bounded caches.
+
+>>> cache = LRUCache(maxsize=2)
+>>> cache.put('a', 1)
+>>> cache.put('b', 2)
+>>> cache.get('a')
+1
+>>> cache.put('c', 3)  # evicts 'b', the least recently used
+>>> cache.get('b') is None, len(cache), cache.evictions
+(True, 2, 1)
+
+The memoize decorator caches the results of a function:
+
+>>> @memoize(maxsize=100, ttl=3600)
+... def lookup(name):
+...     return name.upper()
+>>> lookup('jan'), lookup('jan')
+('JAN', 'JAN')
+>>> lookup.cache_info()
+CacheInfo(hits=1, misses=1, evictions=0, expirations=0, size=1, maxsize=100)
+"""
+
+__all__ = ["LRUCache", "memoize", "memoized_functions", "CacheInfo"]
+
+import time
+import threading
+import weakref
+
+from compat import namedtuple
+
+CacheInfo = namedtuple('CacheInfo',
+                       'hits misses evictions expirations size maxsize')
+
+# fields of the links of the LRU list
+_PREV, _NEXT, _KEY, _VALUE = 0, 1, 2, 3
+
+
+class LRUCache(object):
+    """A mapping holding at most 'maxsize' items which evicts the least
+    recently used one when full. Keeps hits, misses and evictions
+    counters. Not thread safe.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = self.misses = self.evictions = 0
+        self._data = {}
+        # circular doubly linked list of [prev, next, key, value] links,
+        # from the least (root[_NEXT]) to the most recently used
+        self._root = root = []
+        root[:] = [root, root, None, None]
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def _move_to_end(self, link):
+        link[_PREV][_NEXT] = link[_NEXT]
+        link[_NEXT][_PREV] = link[_PREV]
+        root = self._root
+        last = root[_PREV]
+        last[_NEXT] = root[_PREV] = link
+        link[_PREV] = last
+        link[_NEXT] = root
+
+    def get(self, key, default=None):
+        """Return the value of 'key' (marking it as recently used) or
+        'default' if missing.
+        """
+        link = self._data.get(key)
+        if link is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._move_to_end(link)
+        return link[_VALUE]
+
+    def put(self, key, value):
+        """Store 'value' for 'key', evicting the least recently used
+        item if the cache is full.
+        """
+        link = self._data.get(key)
+        if link is not None:
+            link[_VALUE] = value
+            self._move_to_end(link)
+            return
+        if self.maxsize <= 0:
+            return
+        root = self._root
+        if len(self._data) >= self.maxsize:
+            oldest = root[_NEXT]
+            root[_NEXT] = oldest[_NEXT]
+            oldest[_NEXT][_PREV] = root
+            del self._data[oldest[_KEY]]
+            self.evictions += 1
+        last = root[_PREV]
+        link = [last, root, key, value]
+        last[_NEXT] = root[_PREV] = link
+        self._data[key] = link
+
+    def pop(self, key, default=None):
+        """Remove 'key' and return its value, or 'default' if missing."""
+        link = self._data.pop(key, None)
+        if link is None:
+            return default
+        link[_PREV][_NEXT] = link[_NEXT]
+        link[_NEXT][_PREV] = link[_PREV]
+        return link[_VALUE]
+
+    def clear(self):
+        self._data.clear()
+        root = self._root
+        root[:] = [root, root, None, None]
+
+
+class _NoLock(object):
+
+    def acquire(self):
+        pass
+
+    def release(self):
+        pass
+
+
+# weak references to the functions decorated by memoize()
+_memoized = []
+
+
+def memoized_functions():
+    """Return the live functions decorated by memoize()."""
+    functions = [ref() for ref in _memoized]
+    _memoized[:] = [ref for ref, fun in zip(_memoized, functions)
+                    if fun is not None]
+    return [fun for fun in functions if fun is not None]
+
+
+def memoize(fun=None, maxsize=1024, ttl=None, thread_safe=False):
+    """Decorator caching the results of a callable by its (hashable)
+    arguments in an LRU cache of at most 'maxsize' items; if 'ttl' is
+    given results expire after 'ttl' seconds.
+    With thread_safe=True the cache can be shared among threads (e.g.
+    run_in_thread or run_in_pool workers); concurrent calls with the
+    same arguments may still both call the function.
+    The decorated callable has cache_info() returning a CacheInfo
+    tuple and cache_clear(); see also memoized_functions().
+    """
+    def outer(fun):
+        cache = LRUCache(maxsize)
+        lock = thread_safe and threading.Lock() or _NoLock()
+        missing = object()
+        expirations = [0]
+
+        def inner(*args, **kwargs):
+            key = args
+            if kwargs:
+                key += (missing,) + tuple(sorted(kwargs.items()))
+            lock.acquire()
+            try:
+                item = cache.get(key, missing)
+                if item is not missing and ttl is not None and \
+                        item[1] < time.time():
+                    cache.pop(key)
+                    cache.hits -= 1
+                    cache.misses += 1
+                    expirations[0] += 1
+                    item = missing
+            finally:
+                lock.release()
+            if item is not missing:
+                return item[0]
+            result = fun(*args, **kwargs)
+            expires = ttl is not None and time.time() + ttl or None
+            lock.acquire()
+            try:
+                cache.put(key, (result, expires))
+            finally:
+                lock.release()
+            return result
+
+        def cache_info():
+            return CacheInfo(cache.hits, cache.misses, cache.evictions,
+                             expirations[0], len(cache), maxsize)
+
+        def cache_clear():
+            lock.acquire()
+            try:
+                cache.clear()
+                cache.hits = cache.misses = cache.evictions = 0
+                expirations[0] = 0
+            finally:
+                lock.release()
+
+        inner.cache_info = cache_info
+        inner.cache_clear = cache_clear
+        inner.__name__ = fun.__name__
+        inner.__doc__ = fun.__doc__
+        inner.__module__ = fun.__module__
+        _memoized.append(weakref.ref(inner))
+        return inner
+
+    if fun is not None:
+        return outer(fun)
+    return outer
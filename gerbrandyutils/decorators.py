@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+
+##########################################################################
+# Copyright (C) 2009 - 2014 Huygens ING & Gerbrandy S.R.L.
+#
+# This file is part of bioport.
+#
+# bioport is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/gpl-3.0.html>.
+##########################################################################
+
+"""
+Decorators to profile, optimize and run callables in a thread.
+"""
+
+__all__ = ["profile", "optimize", "run_in_thread", "optimize_backends",
+           "default_optimize_backends"]
+
+import sys
+import atexit
+import inspect
+import threading
+
+try:
+    import cProfile
+    import pstats
+except ImportError:
+    cProfile = None  # fix it with "sudo apt-get install python-profiler"
+
+try:
+    import psyco
+except ImportError:
+    psyco = None
+
+from sampling import sampling_profiler
+from cache import memoize
+
+
+if cProfile is not None:
+
+    def _print_stats(profilers, sort, lines, strip_dirs, filename=None):
+        # merge the stats of 'profilers' and print them
+        f = filename and open(filename, 'w') or sys.stdout
+        try:
+            stats = pstats.Stats(profilers[0], stream=f)
+            for prof in profilers[1:]:
+                stats.add(prof)
+            if strip_dirs:
+                stats.strip_dirs()
+            if isinstance(sort, (tuple, list)):
+                stats.sort_stats(*sort)
+            else:
+                stats.sort_stats(sort)
+            stats.print_stats(lines)
+        finally:
+            if f is not sys.stdout:
+                f.close()
+        return stats
+
+    def _accumulating(fun, sort, lines, strip_dirs, filename):
+        # a profiler per thread, stats are merged when reported
+        local = threading.local()
+        lock = threading.Lock()
+        states = []  # [profiler, depth] of each thread
+
+        def inner(*args, **kwargs):
+            state = getattr(local, 'state', None)
+            if state is None:
+                state = local.state = [cProfile.Profile(), 0]
+                lock.acquire()
+                try:
+                    states.append(state)
+                finally:
+                    lock.release()
+            if state[1]:  # recursive call, already being profiled
+                return fun(*args, **kwargs)
+            state[1] += 1
+            try:
+                return state[0].runcall(fun, *args, **kwargs)
+            finally:
+                state[1] -= 1
+
+        def print_stats(filename=filename):
+            """Print the stats accumulated so far by the threads which
+            are not running the function; return a pstats.Stats
+            instance or None if there's nothing to report.
+            """
+            lock.acquire()
+            try:
+                profilers = [prof for prof, depth in states if not depth]
+            finally:
+                lock.release()
+            if profilers:
+                return _print_stats(profilers, sort, lines, strip_dirs,
+                                    filename)
+
+        inner.print_stats = print_stats
+        atexit.register(print_stats)
+        return inner
+
+    def profile(sort='cumulative', lines=50, strip_dirs=False, sample=False,
+                interval=0.001, filename=None, accumulate=False):
+        """A decorator which profiles a callable.
+        By default stats are printed after every call; with
+        accumulate=True stats are merged in memory across calls and
+        threads and printed once at exit (to 'filename' if given) or
+        whenever the print_stats() attribute of the decorated callable
+        is called, which makes it usable on inner loop functions.
+        With sample=True the callable is profiled by the low overhead
+        sampling profiler instead (see gerbrandyutils.sampling), which
+        takes a sample every 'interval' seconds of CPU time and dumps
+        the collapsed stacks of all the calls at exit into 'filename'
+        (default stderr).
+        Example usage:
+
+        >>> @profile
+        ... def factorial(n):
+        ...     n = abs(int(n))
+        ...     if n < 1: 
+        ...             n = 1
+        ...     x = 1
+        ...     for i in range(1, n + 1):
+        ...             x = i * x
+        ...     return x
+        ... 
+        >>> factorial(5)
+        Thu Jul 15 20:58:21 2010    /tmp/tmpIDejr5
+
+                 4 function calls in 0.000 CPU seconds
+
+           Ordered by: internal time, call count
+
+           ncalls  tottime  percall  cumtime  percall filename:lineno(function)
+                1    0.000    0.000    0.000    0.000 profiler.py:120(factorial)
+                1    0.000    0.000    0.000    0.000 {range}
+                1    0.000    0.000    0.000    0.000 {abs}
+                1    0.000    0.000    0.000    0.000 {method 'disable' of '_lsprof.Profiler' objects}
+
+        120
+        >>>
+        """
+        def outer(fun):
+            if sample:
+                def inner(*args, **kwargs):
+                    profiler = sampling_profiler(interval, filename)
+                    profiler.start()
+                    try:
+                        return fun(*args, **kwargs)
+                    finally:
+                        profiler.stop()
+                return inner
+            if accumulate:
+                return _accumulating(fun, sort, lines, strip_dirs, filename)
+
+            def inner(*args, **kwargs):
+                prof = cProfile.Profile()
+                ret = prof.runcall(fun, *args, **kwargs)
+                _print_stats([prof], sort, lines, strip_dirs, filename)
+                return ret
+            return inner
+
+        # in case this is defined as "@profile" instead of "@profile()"
+        if hasattr(sort, '__call__'):
+            fun = sort
+            sort = 'cumulative'
+            outer = outer(fun)
+        return outer
+
+
+def _psyco_backend(fun):
+    psyco.bind(fun)
+    return fun
+
+
+def _numba_backend(fun):
+    import numba
+    return numba.jit(fun)
+
+
+def _memoize_backend(fun, maxsize=1024, ttl=None, thread_safe=False):
+    return memoize(fun, maxsize, ttl, thread_safe)
+
+
+def _available_numba():
+    try:
+        import numba
+    except ImportError:
+        return False
+    return True
+
+
+# name -> (factory(fun, **options), is_available())
+optimize_backends = {
+    'psyco': (_psyco_backend, lambda: psyco is not None),
+    'numba': (_numba_backend, _available_numba),
+    'memoize': (_memoize_backend, lambda: True),
+    'none': (lambda fun: fun, lambda: True),
+}
+# backends tried in order when none is specified
+default_optimize_backends = ['psyco', 'numba', 'none']
+
+
+def _check_options(name, factory, options):
+    try:
+        args, varargs, keywords, defaults = inspect.getargspec(factory)
+    except TypeError:
+        return  # not a plain function, let it complain by itself
+    if keywords:
+        return
+    unknown = sorted(set(options) - set(args[1:]))
+    if unknown:
+        raise ValueError("optimize backend %r does not accept the options %s"
+                         % (name, ", ".join(unknown)))
+
+
+# TODO - can be extended to support python 2.6 class decorators
+def optimize(fun=None, backend=None, **options):
+    """Decorator to optimize a callable; always available.
+    'backend' is one of the names in optimize_backends:
+
+     - 'psyco': binds the callable with psyco (32 bit Python 2.x only)
+     - 'numba': compiles the callable with numba.jit
+     - 'memoize': caches the results of a pure function (see
+       memoize(), whose arguments are accepted as keyword options)
+     - 'none': leaves the callable alone
+
+    By default the first available one of default_optimize_backends is
+    used. New backends can be added to optimize_backends as
+    (factory, is_available) pairs. The work is done once, when the
+    callable is decorated; ValueError is raised if the backend does
+    not accept the given options.
+
+    >>> @optimize
+    ... def sum(a, b):
+    ...     return a + b
+    ...
+    >>> sum(1, 2)
+    3
+    >>> @optimize(backend='memoize', maxsize=100)
+    ... def fib(n):
+    ...     if n < 2:
+    ...         return n
+    ...     return fib(n - 1) + fib(n - 2)
+    ...
+    >>> fib(100)
+    354224848179261915075L
+    >>>
+    """
+    def outer(fun):
+        if backend is None:
+            for name in default_optimize_backends:
+                factory, available = optimize_backends[name]
+                if available():
+                    break
+        else:
+            name = backend
+            try:
+                factory, available = optimize_backends[backend]
+            except KeyError:
+                raise ValueError("unknown optimize backend %r" % backend)
+            if not available():
+                raise RuntimeError("optimize backend %r is not available"
+                                   % backend)
+        if options:
+            _check_options(name, factory, options)
+        return factory(fun, **options)
+
+    if fun is not None:
+        return outer(fun)
+    return outer
+
+
+def run_in_thread(fn):
+    """Decorator to run a callable in a thread returning the 
+    thread instance.
+    Note: completely *NOT* thread safe; see run_in_pool() for a
+    bounded pool of threads returning the results.
+
+    >>> import time
+    >>>
+    >>> @run_in_thread
+    ... def foo():
+    ...     time.sleep(100)
+    ...     return "done"
+    ...
+    >>> t = foo()
+    >>> t.isAlive()
+    True
+    >>> t.join()  # waits for thread completion
+    >>> t.isAlive()
+    False
+    """
+    def run(*k, **kw):
+        t = threading.Thread(target=fn, args=k, kwargs=kw)
+        t.start()
+        return t
+    return run
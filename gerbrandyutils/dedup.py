@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# coding=utf8
+
+##########################################################################
+# Copyright (C) 2009 - 2014 Huygens ING & Gerbrandy S.R.L.
+#
+# This file is part of bioport.
+#
+# bioport is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/gpl-3.0.html>.
+##########################################################################
+
+"""
+Indexes of already seen keys used by ScriptBase.name_already_processed()
+to detect duplicates. They all support "key in index", index.add(key),
+len(index), index.sync() and index.close(sync=True); with sync=False
+the additions since the last sync() may be lost.
+
+ - SetIndex: a plain in-memory set (the default)
+ - FingerprintIndex: a compact in-memory set of 64 bit key hashes
+ - SqliteIndex: an on-disk index which persists between runs
+"""
+
+__all__ = ["SetIndex", "FingerprintIndex", "SqliteIndex", "open_index"]
+
+import array
+import hashlib
+import struct
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+
+class SetIndex(set):
+    """An in-memory set of keys."""
+
+    def sync(self):
+        pass
+
+    def close(self, sync=True):
+        pass
+
+
+class FingerprintIndex(object):
+    """An in-memory set which only stores a fingerprint (the first
+    bytes of the md5 digest) of each key in an open addressing hash
+    table backed by an array.
+    With 8 byte slots and the default max_load of 0.6 (the table
+    doubles when it is 60% full) it takes about 13-27 bytes per key,
+    and up to 40 while growing, as the old and the new table are both
+    allocated (against the ~100 bytes of a set of strings), at the
+    price of a false positive rate of about n / 2**64 on 64 bit
+    platforms.
+    """
+    _bits = array.array('L').itemsize * 8
+
+    def __init__(self, capacity=1024, max_load=0.6):
+        size = 1
+        while size < capacity:
+            size *= 2
+        self._max_load = max_load
+        self._len = 0
+        self._allocate(size)
+
+    def _allocate(self, size):
+        self._table = array.array('L', [0]) * size
+        self._mask = size - 1
+        self._limit = int(size * self._max_load)
+
+    def _fingerprint(self, key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        fp = struct.unpack('<Q', hashlib.md5(key).digest()[:8])[0]
+        fp >>= 64 - self._bits
+        return fp or 1  # 0 marks empty slots
+
+    def _slot(self, fp):
+        table = self._table
+        mask = self._mask
+        i = fp & mask
+        while table[i] and table[i] != fp:
+            i = (i + 1) & mask
+        return i
+
+    def __contains__(self, key):
+        return self._table[self._slot(self._fingerprint(key))] != 0
+
+    def __len__(self):
+        return self._len
+
+    def add(self, key):
+        fp = self._fingerprint(key)
+        i = self._slot(fp)
+        if self._table[i]:
+            return
+        self._table[i] = fp
+        self._len += 1
+        if self._len > self._limit:
+            self._resize()
+
+    def _resize(self):
+        old = self._table
+        self._allocate(len(old) * 2)
+        table = self._table
+        for fp in old:
+            if fp:
+                table[self._slot(fp)] = fp
+
+    def sync(self):
+        pass
+
+    def close(self, sync=True):
+        pass
+
+
+class SqliteIndex(object):
+    """An index stored in a sqlite database which persists between
+    runs. Additions are committed every 'sync_every' keys (if not
+    None) and on sync() / close().
+    """
+
+    def __init__(self, filename, sync_every=10000):
+        if sqlite3 is None:
+            raise RuntimeError("sqlite3 module is not available")
+        self.filename = filename
+        self.sync_every = sync_every
+        self._pending = 0
+        self._conn = sqlite3.connect(filename)
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS keys "
+                           "(key BLOB PRIMARY KEY)")
+
+    @staticmethod
+    def _encode(key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return sqlite3.Binary(key)
+
+    def __contains__(self, key):
+        cursor = self._conn.execute("SELECT 1 FROM keys WHERE key = ?",
+                                    (self._encode(key),))
+        return cursor.fetchone() is not None
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM keys").fetchone()[0]
+
+    def add(self, key):
+        self._conn.execute("INSERT OR IGNORE INTO keys VALUES (?)",
+                           (self._encode(key),))
+        self._pending += 1
+        if self.sync_every and self._pending >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        self._conn.commit()
+        self._pending = 0
+
+    def close(self, sync=True):
+        """Close the database; with sync=False the additions since the
+        last sync() are rolled back.
+        """
+        if self._conn is not None:
+            if sync:
+                self.sync()
+            self._conn.close()
+            self._conn = None
+
+
+def open_index(backend='set', filename=None, sync_every=10000):
+    """Return a new index given its backend name ('set',
+    'fingerprint' or 'sqlite'); 'filename' and 'sync_every' are only
+    used by (and in case of 'filename' required by) 'sqlite'.
+    """
+    if backend == 'set':
+        return SetIndex()
+    elif backend == 'fingerprint':
+        return FingerprintIndex()
+    elif backend == 'sqlite':
+        if not filename:
+            raise ValueError("the sqlite backend requires a filename")
+        return SqliteIndex(filename, sync_every)
+    raise ValueError("unknown dedup backend %r" % backend)
@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+
+##########################################################################
+# Copyright (C) 2009 - 2014 Huygens ING & Gerbrandy S.R.L.
+#
+# This file is part of bioport.
+#
+# bioport is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/gpl-3.0.html>.
+##########################################################################
+
+"""
+Memory accounting of long running imports by stage.
+
+A MemoryMonitor samples the memory of the process in a background
+thread and attributes the growth between two samples, as well as the
+peak, to the stage being run by the thread which created it, much like
+a sampling profiler does with time. This keeps the cost of entering and
+leaving a stage low enough for stages run on every record:
+
+>>> monitor = MemoryMonitor(interval=0.01)
+>>> monitor.start()
+>>> with monitor.stage('parse'):
+...     data = range(100000)
+>>> monitor.stop()
+>>> monitor.peak >= monitor.last.rss > 0
+True
+
+The peak is the high water mark kept by the kernel, so spikes between
+two samples are not missed; they are attributed to the stage sampled
+right after them. Where /proc is not available (e.g. Mac OS X) only
+the peak is known, from getrusage(): the current size, and so the
+growth of the stages, is not reported.
+
+If the tracemalloc module is available (Python >= 3.4) and tracing is
+requested, the allocations which grew the most between samples are
+reported for each stage too.
+"""
+
+__all__ = ["meminfo", "memory_info", "MemoryMonitor"]
+
+import os
+import sys
+import json
+import thread
+import threading
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from compat import namedtuple
+
+meminfo = namedtuple('meminfo', 'rss vms peak')
+
+# name of the samples taken outside of any stage
+OTHER = '(other)'
+
+_PROC_STATUS = '/proc/self/status'
+_PROC_FIELDS = {'VmRSS': 'rss', 'VmSize': 'vms', 'VmHWM': 'peak'}
+
+
+def memory_info():
+    """Return the resident and virtual memory sizes and the peak
+    resident size of this process, in bytes, as a meminfo tuple; rss
+    and vms are None where /proc is not available.
+    """
+    try:
+        f = open(_PROC_STATUS)
+        try:
+            lines = f.readlines()
+        finally:
+            f.close()
+    except IOError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != 'darwin':  # kilobytes but on Mac OS X
+            peak *= 1024
+        return meminfo(None, None, peak)
+    sizes = dict(rss=None, vms=None, peak=None)
+    for line in lines:
+        name, sep, value = line.partition(':')
+        if name in _PROC_FIELDS:
+            sizes[_PROC_FIELDS[name]] = int(value.split()[0]) * 1024
+    if sizes['peak'] is None:
+        sizes['peak'] = sizes['rss'] or 0
+    return meminfo(**sizes)
+
+
+def _mb(size):
+    if size is None:
+        return "n/a"
+    return "%0.1f MB" % (size / 1024.0 / 1024)
+
+
+class MemStat(object):
+    """The memory measurements of a stage."""
+    __slots__ = ('samples', 'growth', 'peak', 'allocations')
+
+    def __init__(self):
+        self.samples = 0
+        self.growth = 0  # sum of the rss growths, in bytes
+        self.peak = 0  # largest rss sampled or high water mark reached
+        self.allocations = {}  # "file:line" -> growth in bytes
+
+    def top(self, n):
+        """Return the 'n' locations which allocated the most."""
+        items = sorted(self.allocations.items(), key=lambda x: -x[1])
+        return [item for item in items[:n] if item[1] > 0]
+
+    def as_dict(self, top, growth=True):
+        # growth is None if the rss is not known
+        data = dict(samples=self.samples, growth=None, peak=self.peak,
+                    top=self.top(top))
+        if growth:
+            data['growth'] = self.growth
+        return data
+
+
+class _Stage(object):
+
+    def __init__(self, stack, name, context):
+        self.stack = stack
+        self.name = name
+        self.context = context
+
+    def __enter__(self):
+        self.stack.append(self.name)
+        if self.context is not None:
+            self.context.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            if self.context is not None:
+                self.context.__exit__(*exc_info)
+        finally:
+            self.stack.pop()
+
+
+class MemoryMonitor(object):
+    """Sample the memory of the process every 'interval' seconds while
+    started. With trace=True (and the tracemalloc module available) the
+    'top' locations which allocated the most are kept for each stage;
+    this slows the process down considerably.
+    """
+
+    def __init__(self, interval=1.0, trace=False, top=5):
+        self.interval = interval
+        self.top = top
+        self.tracing = trace and tracemalloc is not None
+        self.stats = {}
+        self.peak = 0
+        self.last = None
+        self._stack = []
+        self._thread_id = thread.get_ident()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sampler = None
+        self._snapshot = None
+        self._started_tracing = False
+
+    def __getitem__(self, name):
+        return self.stats[name]
+
+    def __contains__(self, name):
+        return name in self.stats
+
+    def stage(self, name, context=None):
+        """Return a context manager attributing the samples taken while
+        it is active to stage 'name'; 'context', if given, is entered
+        and exited by it too. Only stages of the thread which created
+        the monitor are tracked.
+        """
+        if thread.get_ident() != self._thread_id:
+            return _Stage([], name, context)
+        return _Stage(self._stack, name, context)
+
+    def start(self):
+        if self.tracing:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            self._snapshot = self._take_snapshot()
+        self.last = memory_info()
+        self.peak = max(self.peak, self.last.peak)
+        self._stopped.clear()
+        self._sampler = threading.Thread(target=self._run)
+        self._sampler.setDaemon(True)
+        self._sampler.start()
+
+    def stop(self):
+        """Stop sampling, after a last sample."""
+        if self._sampler is None:
+            return
+        self._stopped.set()
+        self._sampler.join()
+        self._sampler = None
+        self.sample()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _run(self):
+        while True:
+            self._stopped.wait(self.interval)
+            if self._stopped.isSet():
+                return
+            self.sample()
+
+    def _take_snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__),
+             tracemalloc.Filter(False, __file__)])
+
+    def sample(self):
+        """Take a sample, attributed to the innermost active stage."""
+        info = memory_info()
+        try:
+            name = self._stack[-1]
+        except IndexError:
+            name = OTHER
+        snapshot = None
+        if self.tracing:
+            snapshot = self._take_snapshot()
+        self._lock.acquire()
+        try:
+            stat = self.stats.get(name)
+            if stat is None:
+                stat = self.stats[name] = MemStat()
+            stat.samples += 1
+            if info.rss is not None and self.last is not None:
+                stat.growth += info.rss - self.last.rss
+            peak = info.rss or 0
+            if info.peak > self.peak:
+                # a new high water mark was reached since the last sample
+                peak = max(peak, info.peak)
+            stat.peak = max(stat.peak, peak)
+            self.peak = max(self.peak, peak)
+            self.last = info
+            if snapshot is not None:
+                allocations = stat.allocations
+                for diff in snapshot.compare_to(self._snapshot, 'lineno'):
+                    frame = diff.traceback[0]
+                    where = "%s:%s" % (frame.filename, frame.lineno)
+                    allocations[where] = (allocations.get(where, 0) +
+                                          diff.size_diff)
+                self._snapshot = snapshot
+        finally:
+            self._lock.release()
+
+    def report(self):
+        """Return the peak memory and the breakdown of the stages, by
+        growth, as a list of lines; growth is "n/a" where the current
+        size is not known.
+        """
+        self._lock.acquire()
+        try:
+            if self.last is None:
+                return []
+            lines = ["peak rss:%s rss:%s vms:%s"
+                     % (_mb(self.peak), _mb(self.last.rss),
+                        _mb(self.last.vms))]
+            known = self.last.rss is not None
+            items = sorted(self.stats.items(),
+                           key=lambda x: (-x[1].growth, -x[1].peak))
+            for name, stat in items:
+                growth = None
+                if known:
+                    growth = stat.growth
+                lines.append("%-12s samples:%-6s growth:%s peak:%s"
+                             % (name, stat.samples, _mb(growth),
+                                _mb(stat.peak)))
+                for where, size in stat.top(self.top):
+                    lines.append("    %s %s" % (_mb(size), where))
+            return lines
+        finally:
+            self._lock.release()
+
+    def as_dict(self):
+        self._lock.acquire()
+        try:
+            last = self.last or meminfo(None, None, 0)
+            known = last.rss is not None
+            return dict(peak=self.peak, rss=last.rss, vms=last.vms,
+                        stages=dict((name, stat.as_dict(self.top, known))
+                                    for name, stat in self.stats.items()))
+        finally:
+            self._lock.release()
+
+    def dump_json(self, filename):
+        f = open(filename, 'w')
+        try:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+        finally:
+            f.close()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+##########################################################################
+# Copyright (C) 2009 - 2014 Huygens ING & Gerbrandy S.R.L.
+#
+# This file is part of bioport.
+#
+# bioport is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/gpl-3.0.html>.
+##########################################################################
+
+"""
+Progress reporting of long running loops.
+"""
+
+__all__ = ["ProgressReporter"]
+
+import time
+
+
+class ProgressReporter(object):
+    """Rate limiter for progress messages which also keeps track of the
+    throughput (as an exponential moving average) in order to estimate
+    the remaining time.
+    Progress is due every 'interval' seconds or every 'every' records,
+    whichever comes first; if both are 0 it is due on every record.
+
+    >>> p = ProgressReporter(interval=0, every=100)
+    >>> p.update(50, now=p.started + 1)
+    False
+    >>> p.update(100, now=p.started + 2)
+    True
+    >>> p.rate, p.eta(100, 1000)
+    (50.0, 18.0)
+    """
+
+    def __init__(self, interval=1.0, every=10000, smoothing=0.3):
+        self.interval = interval
+        self.every = every
+        self.smoothing = smoothing
+        self.rate = None
+        self.started = time.time()
+        self._last_time = self.started
+        self._last_index = 0
+
+    def update(self, index, now=None):
+        """Return True if progress has to be reported at 'index'."""
+        if now is None:
+            now = time.time()
+        elapsed = now - self._last_time
+        count = index - self._last_index
+        if self.interval or self.every:
+            if not ((self.interval and elapsed >= self.interval) or
+                    (self.every and count >= self.every)):
+                return False
+        if elapsed > 0 and count > 0:
+            rate = count / elapsed
+            if self.rate is None:
+                self.rate = rate
+            else:
+                self.rate = (self.smoothing * rate +
+                             (1 - self.smoothing) * self.rate)
+        self._last_time = now
+        self._last_index = index
+        return True
+
+    def eta(self, index, total):
+        """Return the estimated number of seconds to reach 'total' or
+        None if it cannot be estimated yet.
+        """
+        if not self.rate or not total or index >= total:
+            return None
+        return (total - index) / self.rate
+
+
+def _format_seconds(secs):
+    secs = int(secs)
+    return "%d:%02d:%02d" % (secs // 3600, secs // 60 % 60, secs % 60)
@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+
+##########################################################################
+# Copyright (C) 2009 - 2014 Huygens ING & Gerbrandy S.R.L.
+#
+# This file is part of bioport.
+#
+# bioport is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/gpl-3.0.html>.
+##########################################################################
+
+"""
+A compact table of records stored by column, to keep millions of small
+records in memory without paying for a tuple (or an object) per record.
+Each field has a type code:
+
+ - an array module type code ('b', 'B', 'h', 'H', 'i', 'I', 'l', 'L',
+   'f' or 'd'): numbers stored in an array
+ - 's': interned values, each distinct value is stored once and rows
+   only take 4 bytes; meant for repeated values such as a status or
+   a source, but any hashable value (including None) is accepted
+ - 'p': packed strings, concatenated in a single buffer; meant for
+   mostly distinct str or unicode values (or None) such as names
+
+Rows are returned as named tuples:
+
+>>> table = RecordTable('id:l name:p status:s')
+>>> table.append((1, u'Jan', 'written'))
+>>> table.append((2, 'Piet', 'skipped'))
+>>> table[0]
+Record(id=1, name=u'Jan', status='written')
+>>> [row.id for row in table.filter(status='skipped')]
+[2]
+>>> table.update(1, status='written')
+>>> list(table.column('status'))
+['written', 'written']
+"""
+
+__all__ = ["RecordTable", "row_class"]
+
+import array
+import itertools
+
+from compat import namedtuple
+
+# type codes of the columns backed by an array
+ARRAY_TYPECODES = 'bBhHiIlLfd'
+
+# (typename, field names) -> named tuple class
+_row_classes = {}
+
+
+def row_class(typename, field_names):
+    """Return a named tuple class, creating it only the first time it
+    is requested for the same type name and field names.
+    """
+    key = (typename, tuple(field_names))
+    cls = _row_classes.get(key)
+    if cls is None:
+        cls = _row_classes[key] = namedtuple(typename, key[1])
+    return cls
+
+
+class _ArrayColumn(object):
+
+    def __init__(self, typecode):
+        self.data = array.array(typecode)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def append(self, value):
+        self.data.append(value)
+
+    def pop(self):
+        self.data.pop()
+
+    def get(self, i):
+        return self.data[i]
+
+    def set(self, i, value):
+        self.data[i] = value
+
+    def indices(self, value):
+        # indices of the rows holding 'value'
+        return (i for i, v in enumerate(self.data) if v == value)
+
+
+class _InternedColumn(object):
+
+    def __init__(self):
+        self.values = []  # code -> value
+        self.codes = {}  # value -> code
+        self.data = array.array('I')
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        values = self.values
+        return (values[code] for code in self.data)
+
+    def _code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def append(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self._code(value)
+        self.data.append(code)
+
+    def pop(self):
+        # the value stays interned
+        self.data.pop()
+
+    def get(self, i):
+        return self.values[self.data[i]]
+
+    def set(self, i, value):
+        self.data[i] = self._code(value)
+
+    def indices(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            return iter(())
+        return (i for i, c in enumerate(self.data) if c == code)
+
+
+# kinds of the values of a packed column
+_STR, _UNICODE, _NONE = 0, 1, 2
+
+
+class _PackedColumn(object):
+
+    def __init__(self):
+        self.data = array.array('c')
+        self.ends = array.array('L')  # end offset of each value
+        self.kinds = array.array('b')
+
+    def __len__(self):
+        return len(self.ends)
+
+    def __iter__(self):
+        return itertools.imap(self.get, xrange(len(self.ends)))
+
+    def append(self, value):
+        if isinstance(value, str):
+            kind = _STR
+        elif isinstance(value, unicode):
+            kind = _UNICODE
+            value = value.encode('utf-8')
+        elif value is None:
+            kind = _NONE
+            value = ''
+        else:
+            raise TypeError("packed columns only hold strings or None, "
+                            "not %r" % value)
+        data = self.data
+        data.fromstring(value)
+        self.ends.append(len(data))
+        self.kinds.append(kind)
+
+    def pop(self):
+        self.ends.pop()
+        self.kinds.pop()
+        del self.data[self.ends and self.ends[-1] or 0:]
+
+    def get(self, i):
+        if i < 0:
+            i += len(self.ends)
+        kind = self.kinds[i]
+        if kind == _NONE:
+            return None
+        start = i and self.ends[i - 1] or 0
+        value = self.data[start:self.ends[i]].tostring()
+        if kind == _UNICODE:
+            return value.decode('utf-8')
+        return value
+
+    def set(self, i, value):
+        raise TypeError("packed columns can't be updated")
+
+    def indices(self, value):
+        return (i for i, v in enumerate(self) if v == value)
+
+
+class RecordTable(object):
+    """An append only table of records with the given 'fields', either
+    a list of (name, type code) pairs or a string like
+    'id:l name:p status:s' (see the module documentation for the type
+    codes). Rows are returned as instances of a named tuple class
+    called 'typename'.
+    """
+
+    def __init__(self, fields, typename='Record'):
+        if isinstance(fields, basestring):
+            fields = [field.split(':') for field in fields.split()]
+        self.fields = [name for name, typecode in fields]
+        self._columns = []
+        for name, typecode in fields:
+            if typecode == 's':
+                column = _InternedColumn()
+            elif typecode == 'p':
+                column = _PackedColumn()
+            elif typecode in ARRAY_TYPECODES:
+                column = _ArrayColumn(typecode)
+            else:
+                raise ValueError("unknown type code %r of field %r"
+                                 % (typecode, name))
+            self._columns.append(column)
+        self._by_name = dict(zip(self.fields, self._columns))
+        self._appends = [column.append for column in self._columns]
+        self.row = row_class(typename, self.fields)
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError("record index out of range")
+        return self.row._make([column.get(i) for column in self._columns])
+
+    def __iter__(self):
+        return itertools.imap(self.row._make,
+                              itertools.izip(*self._columns))
+
+    def append(self, values):
+        """Append a record given as a sequence of values in field order
+        (e.g. a row of another table).
+        """
+        appends = self._appends
+        if len(values) != len(appends):
+            raise ValueError("expected %s values, got %s"
+                             % (len(appends), len(values)))
+        try:
+            for append, value in zip(appends, values):
+                append(value)
+        except:
+            # remove the values appended to the columns before the one
+            # which rejected its value, or the rows would be misaligned
+            for column in self._columns:
+                if len(column) > self._len:
+                    column.pop()
+            raise
+        self._len += 1
+
+    def extend(self, rows):
+        for values in rows:
+            self.append(values)
+
+    def update(self, i, **values):
+        """Change the given fields of record 'i'; fields of type 'p'
+        can't be changed.
+        """
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError("record index out of range")
+        for name, value in values.items():
+            self._column(name).set(i, value)
+
+    def column(self, name):
+        """Return an iterator over the values of field 'name'."""
+        return iter(self._column(name))
+
+    def filter(self, predicate=None, **values):
+        """Yield the records whose fields are equal to the given keyword
+        arguments and for which predicate(record), if given, is true.
+        """
+        items = values.items()
+        if items:
+            name, value = items.pop()
+            indices = self._column(name).indices(value)
+        else:
+            indices = xrange(self._len)
+        conditions = [(self._column(name), value) for name, value in items]
+        for i in indices:
+            for column, value in conditions:
+                if column.get(i) != value:
+                    break
+            else:
+                row = self[i]
+                if predicate is None or predicate(row):
+                    yield row
+
+    def _column(self, name):
+        try:
+            return self._by_name[name]
+        except KeyError:
+            raise ValueError("unknown field %r" % name)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+##########################################################################
+# Copyright (C) 2009 - 2014 Huygens ING & Gerbrandy S.R.L.
+#
+# This file is part of bioport.
+#
+# bioport is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/gpl-3.0.html>.
+##########################################################################
+
+"""
+A low overhead statistical profiler: instead of tracing every call
+(as cProfile does) the stack of the main thread is sampled every
+'interval' seconds of CPU time by a SIGPROF timer.
+Samples are aggregated as collapsed stacks, one per line:
+
+    main (script.py:10);run (script.py:20);parse (script.py:30) 42
+
+which can be turned into a flame graph with flamegraph.pl.
+Usage:
+
+    with sampling_profiler():
+        ...
+
+or by using @profile(sample=True). The samples of all the profiled
+blocks are aggregated and dumped at exit.
+Only available on UNIX; must be started from the main thread.
+"""
+
+__all__ = ["SamplingProfiler", "sampling_profiler"]
+
+import sys
+import signal
+import atexit
+import collections
+
+
+class SamplingProfiler(object):
+    """Sample the stack of the main thread while started; start() and
+    stop() calls can be nested.
+    """
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.samples = collections.defaultdict(int)
+        self._depth = 0
+        self._old_handler = None
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append("%s (%s:%s)" % (code.co_name, code.co_filename,
+                                         code.co_firstlineno))
+            frame = frame.f_back
+        stack.reverse()
+        self.samples[";".join(stack)] += 1
+
+    def start(self):
+        if not self._depth:
+            self._old_handler = signal.signal(signal.SIGPROF, self._sample)
+            # restart system calls interrupted by the timer
+            signal.siginterrupt(signal.SIGPROF, False)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        self._depth += 1
+
+    def stop(self):
+        self._depth -= 1
+        if not self._depth:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, self._old_handler or signal.SIG_DFL)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def total(self):
+        """Return the number of samples taken so far."""
+        return sum(self.samples.itervalues())
+
+    def collapsed(self):
+        """Return the samples as a list of collapsed stack lines, most
+        frequent first.
+        """
+        items = sorted(self.samples.iteritems(), key=lambda x: -x[1])
+        return ["%s %s" % item for item in items]
+
+    def dump(self, file=None):
+        """Write collapsed stacks into 'file' (a filename or a file
+        object, default sys.stderr).
+        """
+        if not self.samples:
+            return
+        if isinstance(file, basestring):
+            f = open(file, 'w')
+        else:
+            f = file or sys.stderr
+        try:
+            for line in self.collapsed():
+                f.write(line + "\n")
+        finally:
+            if f is not file and f is not sys.stderr:
+                f.close()
+
+
+_profiler = None
+
+
+def sampling_profiler(interval=0.001, filename=None):
+    """Return the process wide SamplingProfiler, whose samples are
+    dumped into 'filename' (default sys.stderr) at exit.
+    Arguments are only used by the first call.
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = SamplingProfiler(interval)
+        atexit.register(_profiler.dump, filename)
+    return _profiler
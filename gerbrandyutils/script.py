@@ -0,0 +1,790 @@
+#!/usr/bin/env python
+
+##########################################################################
+# Copyright (C) 2009 - 2014 Huygens ING & Gerbrandy S.R.L.
+#
+# This file is part of bioport.
+#
+# bioport is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/gpl-3.0.html>.
+##########################################################################
+
+"""
+ScriptBase, the base class of import scripts.
+"""
+
+__all__ = ["ScriptBase", "Skip", "shard_path"]
+
+import os
+import sys
+import tarfile
+import shutil
+import time
+import itertools
+import collections
+import multiprocessing
+import json
+import hashlib
+import thread
+import warnings
+from cStringIO import StringIO
+
+import dedup
+import writer
+import archive
+import timing
+import threadpool
+import memory
+from archive import make_tarfile
+from cache import memoized_functions
+from progress import ProgressReporter, _format_seconds
+from records import RecordTable
+from gerbrandyutils import hilite
+
+
+def shard_path(name, depth=2, width=2):
+    """Return the relative path of 'name' in a directory tree of 'depth'
+    levels named after the first 'depth' * 'width' hex digits of the
+    md5 of 'name' (of its UTF-8 encoding if unicode).
+
+    >>> shard_path('123.xml')
+    '98/ef/123.xml'
+    """
+    data = name
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    digest = hashlib.md5(data).hexdigest()
+    parts = [digest[i * width:(i + 1) * width] for i in range(depth)]
+    parts.append(name)
+    return os.path.join(*parts)
+
+
+def _id_key(id):
+    # ids are compared as unicode strings, as read back from the journal
+    if id is None or isinstance(id, unicode):
+        return id
+    return str(id).decode('utf-8', 'replace')
+
+
+class Skip(Exception):
+    """Raised by the callable passed to ScriptBase.run() in order to
+    skip the current record. The first argument, if any, is used as
+    the skip reason.
+    """
+
+
+class _NoStage(object):
+    # returned by ScriptBase.stage() when stages are neither timed nor
+    # measured
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+_NO_STAGE = _NoStage()
+
+
+def _apply_process_fn(args):
+    # executed in the worker processes, hence it has to be a module
+    # level function in order to be pickled
+    fun, record = args
+    try:
+        return True, fun(record)
+    except Skip, err:
+        return False, err.args and err.args[0] or ""
+
+
+def _apply_process_chunk(jobs):
+    return [_apply_process_fn(job) for job in jobs]
+
+
+def _pool_results(pool, jobs, workers, chunksize):
+    # like pool.imap(_apply_process_fn, jobs, chunksize) but 'jobs' is
+    # consumed lazily: at most two chunks per worker are pending
+    pending = collections.deque()
+    while True:
+        chunk = list(itertools.islice(jobs, chunksize))
+        if chunk:
+            pending.append(pool.apply_async(_apply_process_chunk, (chunk,)))
+        if pending and (not chunk or len(pending) >= workers * 2):
+            for result in pending.popleft().get():
+                yield result
+        if not chunk and not pending:
+            break
+
+    
+class ScriptBase(object):
+    """A base class which can be used with import scripts.
+    It provides facilities to:
+    
+     - print progress, at most every progress_interval seconds or
+       progress_every records
+     - print results (coloured)
+     - gracefully add skipped imports during script iteration
+     - detect already processed names, optionally by using a compact
+       or persistent index (see dedup_backend)
+     - write files in a safe manner (in case of errors, files are removed
+       before exiting the interpreter), optionally in background threads
+       (see writer_threads)
+     - optionally spread files over hash-prefixed subdirectories of the
+       out dir (see shard_depth)
+     - compress generated files, either on exit or by streaming them
+       into the archive as they are written (see stream_archive)
+     - process records in parallel (see run()) or fetch them
+       concurrently from remote hosts (see run_io())
+     - report the statistics of memoized functions on exit
+     - time the stages of the import (see stage() and time_stages)
+     - checkpoint the progress of a run in a journal and resume it
+       after a crash (see checkpoint and resume)
+     - keep the outcome of every record in a compact table (see
+       keep_records)
+     - sample the memory used by each stage (see memory_interval)
+    """
+    compress_on_exit = True
+    remove_output_dir_on_start = True
+    archive_filename = 'out.tar.gz'
+    # see gerbrandyutils.archive; 'pgz' compresses by using all the CPUs
+    archive_compression = 'gz'
+    archive_level = 9
+    # append each file to archive_filename as soon as it is written
+    # instead of compressing the whole out dir on exit
+    stream_archive = False
+    # whether to also write files into the out dir (only meaningful
+    # in conjunction with stream_archive)
+    write_loose_files = True
+    # one of 'set', 'fingerprint' or 'sqlite' (see gerbrandyutils.dedup);
+    # the sqlite index is stored in dedup_filename and is only reset
+    # if remove_output_dir_on_start is True
+    dedup_backend = 'set'
+    dedup_filename = 'names.db'
+    # keep a journal of written ids, skips and processed names in
+    # checkpoint_filename, flushed every checkpoint_interval records
+    checkpoint = False
+    checkpoint_filename = 'out.journal'
+    checkpoint_interval = 1000
+    # continue the run recorded in checkpoint_filename (if any) instead
+    # of starting from scratch; implies checkpoint
+    resume = False
+    progress_interval = 1.0
+    progress_every = 10000
+    # number of threads writing files in background (0 means files are
+    # written synchronously by write_file()), the max number of files
+    # waiting to be written and whether to fsync each file
+    writer_threads = 0
+    writer_queue_size = 1000
+    writer_fsync = False
+    # number of levels of subdirectories of the out dir files are spread
+    # over (see shard_path()) and number of hex digits naming each level;
+    # archive member names are not affected
+    shard_depth = 0
+    shard_width = 2
+    # time the stages of the import (see stage()) and show them on exit;
+    # off by default as it costs a few microseconds per record and stage
+    time_stages = False
+    # if set, stage timings are also exported as JSON into this file
+    # (implies time_stages)
+    timings_filename = None
+    # number of ids of skipped records kept as a sample of each skip
+    # reason and, if set, file the skip reasons are exported into as JSON
+    skip_sample_size = 10
+    skip_report_filename = None
+    # keep the id, name and status ('written' or the skip reason) of
+    # each record processed by run() in self.records, a RecordTable
+    # (see gerbrandyutils.records); ids are stored as unicode strings
+    keep_records = False
+    # show the statistics of memoize()d functions on exit
+    report_caches = True
+    # if set, the memory of the process is sampled every memory_interval
+    # seconds and the growth and peak of each stage are shown on exit
+    # (see gerbrandyutils.memory); memory_tracemalloc also reports the
+    # memory_top lines which allocated the most, where tracemalloc is
+    # available, and memory_filename is the file they are exported
+    # into as JSON
+    memory_interval = None
+    memory_tracemalloc = False
+    memory_top = 5
+    memory_filename = None
+
+    def __init__(self):
+        # check the configuration before anything which needs to be
+        # torn down is set up
+        self._exited = True
+        if self.resume and self.stream_archive:
+            raise ValueError("stream_archive can't be used to resume a run")
+        self.total = 0
+        self._skipped = 0
+        self._imported = 0
+        self._exited = False
+        self._skip_reasons = {}  # reason -> number of skips
+        self._skip_samples = {}  # reason -> ids of the first skips
+        self._started = time.time()
+        self._time_stages = bool(self.time_stages or self.timings_filename)
+        # stages are only recorded for the thread which created the script
+        self.timings = timing.Timings(thread_safe=False)
+        self._thread_id = thread.get_ident()
+        self.memory = None
+        if self.memory_interval:
+            if self.memory_tracemalloc and memory.tracemalloc is None:
+                warnings.warn("tracemalloc is not available, memory "
+                              "allocations won't be traced", RuntimeWarning)
+            self.memory = memory.MemoryMonitor(self.memory_interval,
+                                               self.memory_tracemalloc,
+                                               self.memory_top)
+            self.memory.start()
+        # whether stage() has anything to do
+        self._staged = self._time_stages or self.memory is not None
+        self._progress = ProgressReporter(self.progress_interval,
+                                          self.progress_every)
+        self._archive = None
+        self._writer = None
+        self._shard_dirs = set()
+        self._journal = None
+        self._journal_events = []
+        self._journal_complete = 0  # number of events of complete records
+        self._journal_records = 0
+        self._write_failures = 0
+        self._done = set()
+        self.records = None
+        if self.keep_records:
+            self.records = RecordTable('id:p name:p status:s')
+        resuming = self.resume and os.path.exists(self.checkpoint_filename)
+        if self.remove_output_dir_on_start and not resuming:
+            self.safe_remove('out')
+            self.safe_remove(self.dedup_filename)
+            self.safe_remove(self.checkpoint_filename)
+        checkpoint = self.checkpoint or self.resume
+        # with checkpoints the sqlite index is only committed together
+        # with the journal, so that they are always consistent
+        self._lowercase_names = dedup.open_index(
+            self.dedup_backend, self.dedup_filename,
+            sync_every=not checkpoint and 10000 or None)
+        if resuming:
+            self._replay_journal()
+            self._remove_temporary_files()
+        if checkpoint:
+            self._journal = open(self.checkpoint_filename, 'a')
+        if not os.path.isdir('out'):
+            os.mkdir('out')       
+        if self.stream_archive:
+            self._archive = archive.open_tarfile(self.archive_filename,
+                                                 self.archive_compression,
+                                                 self.archive_level)
+        if self.writer_threads:
+            self._writer = writer.AsyncWriter(self.writer_threads,
+                                              self.writer_queue_size,
+                                              self.writer_fsync)
+
+    def __del__(self):
+        if not self._exited:
+            self._tear_down()
+
+    def _tear_down(self):
+        self._exited = True
+        write_errors = []
+        if self._writer is not None:
+            write_errors = self._writer.close()
+            for err in write_errors:
+                self._write_failed(err)
+        sync_index = True
+        if self._journal is not None:
+            # on write errors the journal is left at the last checkpoint
+            self._flush_journal()
+            self._journal.close()
+            # names of records which are not in the journal must not be
+            # committed either; the journaled ones are added again from
+            # the journal when resuming
+            sync_index = not self._write_failures and \
+                not self._journal_events
+        self._lowercase_names.close(sync=sync_index)
+        with self.stage('compress'):
+            if self._archive is not None:
+                self._archive.close()
+            elif self.compress_on_exit:
+                self._compress_output_files()
+        if self.memory is not None:
+            self.memory.stop()
+        elapsed = time.time() - self._started
+        hl = hilite
+        print "total:%s imported:%s skipped=%s in %s secs" \
+           % (hl(self.total), hl(self._imported), hl(self._skipped),
+              hl("%0.3f" % elapsed))
+        report = self.skip_report()
+        if report:
+            print "skip reasons:"
+            for item in report:
+                line = "(%s) %s" % (hl(item['count'], 0), item['reason'])
+                if item['ids']:
+                    line += " ids: %s" % ", ".join(
+                        [id.encode('utf-8') for id in item['ids']])
+                print line
+        if self._time_stages:
+            print "stages:"
+            for line in self.timings.report(elapsed):
+                print line
+        if self.report_caches:
+            lines = self.cache_report()
+            if lines:
+                print "caches:"
+                for line in lines:
+                    print line
+        if self.memory is not None:
+            print "memory:"
+            for line in self.memory.report():
+                print line
+            if self.memory_filename:
+                self.memory.dump_json(self.memory_filename)
+        if self.timings_filename:
+            self.timings.dump_json(self.timings_filename)
+        if self.skip_report_filename:
+            f = open(self.skip_report_filename, 'w')
+            try:
+                json.dump(dict(skipped=self._skipped, reasons=report), f,
+                          indent=2)
+            finally:
+                f.close()
+        if write_errors:
+            raise write_errors[0]
+
+    def cache_report(self):
+        """Return the statistics of the functions decorated by memoize()
+        which have been called, as a list of lines.
+        """
+        lines = []
+        for fun in memoized_functions():
+            info = fun.cache_info()
+            if not info.hits and not info.misses:
+                continue
+            lines.append("%s.%s hits:%s misses:%s evictions:%s expired:%s "
+                         "size:%s/%s" % ((fun.__module__, fun.__name__) +
+                                         tuple(info)))
+        return lines
+
+    def stage(self, name):
+        """Return a context manager timing the named stage of the
+        import, reported on exit. ScriptBase itself times 'transform'
+        (see run()), 'dedup', 'write' and 'compress'; scripts can add
+        their own, e.g.:
+
+            with self.stage('parse'):
+                root = etree.parse(fn)
+
+        Stages are only timed with time_stages (or timings_filename)
+        set; with memory_interval set, the memory samples taken while
+        the stage runs are attributed to it as well. Only the stages
+        entered by the thread which created the script are recorded.
+        """
+        if not self._staged or thread.get_ident() != self._thread_id:
+            return _NO_STAGE
+        timer = None
+        if self._time_stages:
+            timer = self.timings.timer(name)
+        if self.memory is None:
+            return timer
+        return self.memory.stage(name, timer)
+
+    def skip(self, reason="", id=None):
+        """Adds a message to the skip reasons shown on exit.
+        'id' identifies the skipped record in the checkpoint journal,
+        so that it is not processed again when resuming.
+        """
+        self._skipped += 1
+        if reason:
+            self._count_skip(reason, _id_key(id))
+        if self._journal is not None:
+            self._journal_events.append(("s", reason, _id_key(id)))
+            self._end_of_record(id)
+
+    def _count_skip(self, reason, id):
+        self._skip_reasons[reason] = self._skip_reasons.get(reason, 0) + 1
+        if id is not None:
+            sample = self._skip_samples.setdefault(reason, [])
+            if len(sample) < self.skip_sample_size:
+                sample.append(id)
+
+    def skip_report(self):
+        """Return the skip reasons, most frequent first, as a list of
+        dicts with the reason, the number of skips and the ids of (at
+        most skip_sample_size of) the skipped records.
+        """
+        items = sorted(self._skip_reasons.items(),
+                       key=lambda item: (-item[1], item[0]))
+        return [dict(reason=reason, count=count,
+                     ids=self._skip_samples.get(reason, []))
+                for reason, count in items]
+
+    def already_done(self, id):
+        """Return True if the record identified by 'id' has already been
+        written or skipped by the run being resumed.
+        """
+        return _id_key(id) in self._done
+
+    def _end_of_record(self, id):
+        if id is not None:
+            self._done.add(_id_key(id))
+        self._journal_complete = len(self._journal_events)
+        self._journal_records += 1
+        if self._journal_records >= self.checkpoint_interval:
+            self._flush_journal()
+
+    def _flush_journal(self):
+        # only the events of complete records are flushed: a record is
+        # either completely in the journal or not at all
+        if self._writer is not None and not self._write_failures:
+            # written ids must be on disk before being journaled
+            try:
+                self._writer.drain()
+            except writer.WriteError, err:
+                self._write_failed(err)
+                raise
+        if self._write_failures:
+            # some of the files journaled as written may be missing:
+            # the journal is left at the last checkpoint
+            self._journal_events = []
+            self._journal_complete = self._journal_records = 0
+            return
+        events = self._journal_events
+        complete = self._journal_complete
+        write = self._journal.write
+        for event in events[:complete]:
+            write(json.dumps(event) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        if complete == len(events):
+            # the sqlite index is committed together with the journal
+            self._lowercase_names.sync()
+        self._journal_events = events[complete:]
+        self._journal_complete = 0
+        self._journal_records = 0
+
+    def _replay_journal(self):
+        # the journal is replayed record by record: the names of a
+        # record are only added once its "w" or "s" event is read, and
+        # whatever follows the last complete record (cut by a crash)
+        # is truncated
+        f = open(self.checkpoint_filename, 'rb')
+        offset = end = 0  # end of the last line / of the last record
+        names = []  # names of the record being read
+        try:
+            for line in f:
+                if not line.endswith("\n"):  # truncated by a crash
+                    break
+                try:
+                    event = json.loads(line)
+                except ValueError:  # ditto
+                    break
+                offset += len(line)
+                if event[0] == "n":
+                    names.append(event[1])
+                    continue
+                elif event[0] == "nb":
+                    names.append(event[1].encode('latin-1'))
+                    continue
+                for name in names:
+                    self._lowercase_names.add(name)
+                names = []
+                end = offset
+                if event[0] == "w":
+                    self._imported += 1
+                    self._done.add(event[1])
+                    self._keep_record(event[1], None, "written")
+                elif event[0] == "s" and event[2] is not None:
+                    # skips without an id are not counted as the record
+                    # is going to be processed (and skipped) again
+                    self._skipped += 1
+                    if event[1]:
+                        self._count_skip(event[1], event[2])
+                    self._done.add(event[2])
+                    self._keep_record(event[2], None, event[1] or "skipped")
+        finally:
+            f.close()
+        # or the events journaled from now on would be appended to the
+        # partial record, and lost on the next resume
+        if os.path.getsize(self.checkpoint_filename) > end:
+            f = open(self.checkpoint_filename, 'r+b')
+            try:
+                f.truncate(end)
+            finally:
+                f.close()
+
+    def name_already_processed(self, name):
+        """Return True if the name of the person has already been
+        processed to avoid duplicate persons.
+        """
+        if not self._staged:
+            return self._name_already_processed(name)
+        with self.stage('dedup'):
+            return self._name_already_processed(name)
+
+    def _name_already_processed(self, name):
+        if not name:
+            return True
+        lowercased_name = name.lower()
+        if lowercased_name in self._lowercase_names:
+            return True
+        else:
+            self._lowercase_names.add(lowercased_name)
+            if self._journal is not None:
+                if isinstance(lowercased_name, unicode):
+                    event = ("n", lowercased_name)
+                else:
+                    event = ("nb", lowercased_name.decode('latin-1'))
+                self._journal_events.append(event)
+            return False
+        
+    def run(self, records, process_fn, workers=1, chunksize=1, key=None):
+        """Process 'records' by calling 'process_fn' on each of them,
+        optionally by using a pool of 'workers' processes.
+
+        'process_fn' is called with a record and is expected to return
+        an (id, name, bdes) tuple; it can either return None or raise
+        Skip(reason) in order to skip the record.
+        Progress, name deduplication, skips and file writing always
+        happen in this process and in input order, so that the output
+        is the same regardless of the number of workers.
+
+        With workers > 1 'process_fn' must be a module level function
+        and both records and returned values must be picklable;
+        'records' is consumed lazily, at most two chunks of 'chunksize'
+        records per worker are in flight at any time.
+
+        'key', if given, is called with a record and must return the
+        id of the record; it is required in order to leave out records
+        which are already done when resuming a run.
+        """
+        ids = collections.deque()
+        jobs = self._jobs(records, process_fn, key, ids)
+        pool = None
+        if workers > 1:
+            pool = multiprocessing.Pool(workers)
+            results = _pool_results(pool, jobs, workers, chunksize)
+        else:
+            results = itertools.imap(_apply_process_fn, jobs)
+        try:
+            self._handle_results(results, ids)
+        except:
+            if pool is not None:
+                pool.terminate()
+            raise
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    def run_io(self, records, process_fn, concurrency=10, per_host=2,
+               delay=0, host=None, key=None):
+        """Like run() but for an I/O bound 'process_fn', such as one
+        fetching each record over HTTP from a partner repository: it is
+        called by a pool of 'concurrency' threads, so that waiting on
+        the network overlaps.
+
+        'host', if given, is called with a record and must return the
+        host the record is fetched from (or None): at most 'per_host'
+        calls at a time are made for records of the same host, started
+        at least 'delay' seconds apart (see threadpool.HostLimiter).
+
+        As with run(), progress, name deduplication, skips and file
+        writing happen in this thread and in input order.
+        """
+        ids = collections.deque()
+        jobs = self._jobs(records, process_fn, key, ids)
+        limiter = threadpool.HostLimiter(per_host, delay)
+
+        def call(job):
+            name = host is not None and host(job[1]) or None
+            if name is None:
+                return _apply_process_fn(job)
+            limiter.acquire(name)
+            try:
+                return _apply_process_fn(job)
+            finally:
+                limiter.release(name)
+        pool = threadpool.ThreadPool(concurrency)
+        try:
+            self._handle_results(pool.map(call, jobs), ids)
+        except:
+            pool.shutdown(wait=False)
+            raise
+        pool.shutdown()
+
+    def _jobs(self, records, process_fn, key, ids):
+        # return the iterator of the (process_fn, record) jobs of run()
+        # and run_io(), leaving out records already done; their ids are
+        # appended to 'ids' as they are consumed
+        if not self.total and hasattr(records, '__len__'):
+            self.total = len(records)
+
+        def jobs():
+            for record in records:
+                id = None
+                if key is not None:
+                    id = key(record)
+                    if self.already_done(id):
+                        continue
+                ids.append(id)
+                yield process_fn, record
+        return jobs()
+
+    def _handle_results(self, results, ids):
+        if self._staged:
+            results = self._timed_iter('transform', results)
+        for index, (ok, result) in enumerate(results):
+            id = ids.popleft()
+            if not ok or result is None:
+                self.print_progress(index + 1)
+                reason = ok and "" or result
+                self.skip(reason, id)
+                self._keep_record(id, None, reason or "skipped")
+                continue
+            id, name, bdes = result
+            self.print_progress(index + 1, name)
+            if name is not None and self.name_already_processed(name):
+                self.skip("duplicate name", id)
+                self._keep_record(id, name, "duplicate name")
+                continue
+            self.write_file(bdes, id)
+            self._keep_record(id, name, "written")
+
+    def _keep_record(self, id, name, status):
+        if self.records is not None:
+            self.records.append((_id_key(id), name, status))
+
+    def _timed_iter(self, name, iterator):
+        while True:
+            with self.stage(name):
+                try:
+                    item = iterator.next()
+                except StopIteration:
+                    return
+            yield item
+
+    def print_progress(self, index, name=None):
+        """Print the progress of the script; this is rate limited (see
+        progress_interval and progress_every) so it can be called on
+        every record.
+        """
+        progress = self._progress
+        if not progress.update(index):
+            return
+        s = "processing: %s/%s" % (index, self.total)
+        if progress.rate is not None:
+            s += " %0.1f rec/s" % progress.rate
+        eta = progress.eta(index, self.total)
+        if eta is not None:
+            s += " eta %s" % _format_seconds(eta)
+        s += " imported:%s skipped:%s" % (self._imported, self._skipped)
+        if name is not None:
+            s += " - " + repr(name)
+        sys.stdout.write(s + "\n")
+       
+    def write_file(self, bdes, id):
+        if not self._staged:
+            return self._write_file(bdes, id)
+        with self.stage('write'):
+            self._write_file(bdes, id)
+
+    def _write_file(self, bdes, id):
+        #index = str(index).zfill(len(str(self.total)))
+        basename = "%s.xml" % id
+        filename = self.output_path(basename)
+        try:
+            if self._archive is None and self._writer is None:
+                bdes.to_file(filename)
+            else:
+                data = bdes.to_string()
+                if isinstance(data, unicode):
+                    data = data.encode('utf-8')
+                if self._archive is None or self.write_loose_files:
+                    self._write_data(filename, data)
+                if self._archive is not None:
+                    self._add_to_archive(basename, data)
+        except writer.WriteError, err:
+            # a file previously queued to the background writer
+            self._write_failed(err)
+            raise
+        except:
+            self.safe_remove(filename)
+            raise
+        self._imported += 1
+        if self._journal is not None:
+            self._journal_events.append(("w", _id_key(id)))
+            self._end_of_record(id)
+        
+        #from lxml import etree
+        #namestring = bdes.get_namen()[0].to_string()
+        #etree.fromstring(namestring)
+
+    def output_path(self, name):
+        """Return the path where the output file 'name' is written,
+        creating its directory if needed.
+        """
+        if not self.shard_depth:
+            return os.path.join('out', name)
+        path = os.path.join('out', shard_path(name, self.shard_depth,
+                                              self.shard_width))
+        dir = os.path.dirname(path)
+        if dir not in self._shard_dirs:
+            if not os.path.isdir(dir):
+                os.makedirs(dir)
+            self._shard_dirs.add(dir)
+        return path
+
+    def _write_data(self, filename, data):
+        if self._writer is not None:
+            self._writer.write(filename, data)
+        else:
+            f = open(filename, 'wb')
+            try:
+                f.write(data)
+            finally:
+                f.close()
+
+    def _write_failed(self, err):
+        self._write_failures += 1
+        self._imported -= 1
+        self.safe_remove(err.filename)
+        print hilite(err, 0)
+
+    def _remove_temporary_files(self):
+        # left in the out dir by atomic_write() when a run is killed
+        for root, dirs, names in os.walk('out'):
+            for name in names:
+                if name.endswith('.tmp'):
+                    self.safe_remove(os.path.join(root, name))
+
+    def _add_to_archive(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = time.time()
+        info.mode = 0644
+        self._archive.addfile(info, StringIO(data))
+
+    @classmethod
+    def safe_remove(self, path):
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    def _compress_output_files(self):
+        make_tarfile('out', self.archive_filename,
+                     flatten=bool(self.shard_depth),
+                     compression=self.archive_compression,
+                     level=self.archive_level)
+#        tar = tarfile.open("out.tar.gz", "w:gz")
+#        for name in os.listdir("out"):
+#            tar.add("out/" + name, arcname=name)
+#        tar.close()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+##########################################################################
+# Copyright (C) 2009 - 2014 Huygens ING & Gerbrandy S.R.L.
+#
+# This file is part of bioport.
+#
+# bioport is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/gpl-3.0.html>.
+##########################################################################
+
+"""
+Helpers to run shell command lines.
+"""
+
+__all__ = ["sh", "sh_iter", "sh_batch", "ShResult"]
+
+import os
+import signal
+import subprocess
+import threading
+import warnings
+import Queue
+
+from compat import namedtuple
+
+
+class ShResult(namedtuple('ShResult',
+                         'cmdline returncode stdout stderr timed_out')):
+    """The outcome of a command line run by sh_batch()."""
+    __slots__ = ()
+
+    def check(self):
+        """Return stdout with the same semantics of sh(): raise
+        RuntimeError if the command failed (or timed out) and warn
+        if it wrote on stderr.
+        """
+        if self.timed_out:
+            raise RuntimeError("%r timed out\n%s" % (self.cmdline,
+                                                     self.stderr))
+        if self.returncode != 0:
+            raise RuntimeError(self.stderr)
+        if self.stderr:
+            warnings.warn(self.stderr, RuntimeWarning)
+        return self.stdout
+
+
+def _run(cmdline, timeout=None):
+    if timeout is None:
+        p = subprocess.Popen(cmdline, shell=1, stdout=subprocess.PIPE,
+                                               stderr=subprocess.PIPE)
+        stdout, stderr = p.communicate()
+        return ShResult(cmdline, p.returncode, stdout, stderr, False)
+    # run the shell in its own process group so that on timeout its
+    # children get killed too (or they'd keep the pipes open)
+    p = subprocess.Popen(cmdline, shell=1, stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE, preexec_fn=os.setsid)
+    timed_out = []
+
+    def kill():
+        timed_out.append(True)
+        try:
+            os.killpg(p.pid, signal.SIGKILL)
+        except OSError:
+            pass
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+    try:
+        stdout, stderr = p.communicate()
+    finally:
+        timer.cancel()
+    return ShResult(cmdline, p.returncode, stdout, stderr, bool(timed_out))
+
+
+def sh(cmdline):
+    """run cmd in a subprocess and return its output.
+    raises RuntimeError on error.
+    """
+    return _run(cmdline).check()
+
+
+def sh_iter(cmdline, chunksize=None):
+    """Like sh() but yield the output of cmd as it is produced, line by
+    line or, if 'chunksize' is given, in chunks of at most 'chunksize'
+    bytes, so that huge outputs are never held in memory.
+    stderr is collected by a separate thread (so the command can't
+    block on a full pipe) and sh()'s semantics apply once the command
+    exits: RuntimeError is raised on error, a warning is issued if
+    something was written on stderr.
+    Closing the generator before the end kills the command.
+
+    >>> for line in sh_iter("mysqldump bioport"):
+    ...     out.write(line)
+    """
+    # in its own process group, like in _run(), so that closing early
+    # kills the whole pipeline and not just the shell
+    # buffered, or readline() reads one byte at a time
+    p = subprocess.Popen(cmdline, shell=1, bufsize=-1, stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE, preexec_fn=os.setsid)
+    stderr = []
+    t = threading.Thread(target=lambda: stderr.append(p.stderr.read()))
+    t.setDaemon(True)
+    t.start()
+    completed = False
+    try:
+        if chunksize:
+            read = lambda: p.stdout.read(chunksize)
+        else:
+            read = p.stdout.readline
+        for data in iter(read, ''):
+            yield data
+        completed = True
+    finally:
+        if not completed:
+            try:
+                os.killpg(p.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        p.stdout.close()
+        p.wait()
+        t.join()
+        p.stderr.close()
+    ShResult(cmdline, p.returncode, None, "".join(stderr), False).check()
+
+
+def sh_batch(cmdlines, workers=4, timeout=None):
+    """Run 'cmdlines' in subprocesses, at most 'workers' at a time,
+    killing those lasting more than 'timeout' seconds, and yield an
+    ShResult for each of them as soon as it finishes (so not in input
+    order). Call check() on a result to get sh()'s behaviour:
+
+    >>> for result in sh_batch(["xmllint --noout %s" % fn for fn in files]):
+    ...     try:
+    ...         result.check()
+    ...     except RuntimeError, err:
+    ...         print result.cmdline, err
+    """
+    # imported here as it pulls in multiprocessing, which sh() does not need
+    from threadpool import ThreadPool
+    pool = ThreadPool(workers)
+    finished = Queue.Queue()
+    running = 0
+    try:
+        for cmdline in cmdlines:
+            pool.submit(_run, cmdline, timeout).add_done_callback(finished.put)
+            running += 1
+            while running >= workers * 2 or not finished.empty():
+                running -= 1
+                yield finished.get().result()
+        while running:
+            running -= 1
+            yield finished.get().result()
+    finally:
+        pool.shutdown(wait=False)
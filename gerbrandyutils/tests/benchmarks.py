@@ -0,0 +1,606 @@
+#!/usr/bin/env python
+
+##########################################################################
+# Copyright (C) 2009 - 2014 Huygens ING & Gerbrandy S.R.L.
+#
+# This file is part of bioport.
+#
+# bioport is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/gpl-3.0.html>.
+##########################################################################
+
+"""
+Benchmarks of gerbrandyutils hot paths, run offline on synthetic
+fixtures. They are not part of the test suite; run them with:
+
+    python -m gerbrandyutils.tests.benchmarks [options] [name ...]
+
+Every measurement is repeated (after some warmup runs) and summarized
+by its median, mean, standard deviation and throughput. Results can be
+saved as JSON with -o and compared with those of a previous run, e.g.
+of another commit, with -c:
+
+    python -m gerbrandyutils.tests.benchmarks -o before.json
+    git checkout other-branch
+    python -m gerbrandyutils.tests.benchmarks -c before.json
+
+Sizes are multiplied by -s, e.g. "-s 10 dedup" runs the name dedup
+benchmark on 10^7 names; -l lists the benchmarks.
+"""
+
+import os
+import sys
+import math
+import time
+import json
+import shutil
+import tempfile
+import random
+import optparse
+import subprocess
+import contextlib
+import multiprocessing
+from StringIO import StringIO
+
+from gerbrandyutils import normalize_url, normalize_urls, normalize_url_file
+from gerbrandyutils import sh, sh_iter, sh_batch, profile, ScriptBase
+from gerbrandyutils.archive import make_tarfile
+from gerbrandyutils.memory import memory_info
+from gerbrandyutils.records import RecordTable
+from gerbrandyutils.urls import _url_caches
+from gerbrandyutils.tests.fixtures import biography, Biodes
+from gerbrandyutils.tests.fixtures import RepositoryServer, fetcher
+
+# root of the source tree, the benchmarks run from
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+# benchmark name -> summary of its measurements, filled by report()
+results = {}
+
+
+def _parser():
+    parser = optparse.OptionParser(usage="%prog [options] [name ...]")
+    parser.add_option('-r', '--repeat', type='int', default=5,
+                      help="number of measured runs [default: %default]")
+    parser.add_option('-w', '--warmup', type='int', default=1,
+                      help="number of runs before measuring "
+                           "[default: %default]")
+    parser.add_option('-s', '--scale', type='float', default=1.0,
+                      help="multiply the size of the fixtures "
+                           "[default: %default]")
+    parser.add_option('-o', '--output',
+                      help="save the results as JSON into this file")
+    parser.add_option('-c', '--compare',
+                      help="compare the results with those saved into "
+                           "this file by -o")
+    parser.add_option('-l', '--list', action='store_true',
+                      help="list the benchmarks")
+    return parser
+
+options = _parser().get_default_values()
+
+
+def size(n):
+    """Return the size 'n' of a fixture scaled by the -s option."""
+    return max(1, int(n * options.scale))
+
+
+def rss():
+    """Return the resident set size of this process in bytes, or its
+    peak where the current size is not known.
+    """
+    info = memory_info()
+    if info.rss is None:
+        return info.peak
+    return info.rss
+
+
+def in_subprocess(fun, *args):
+    """Run fun(*args) in a fresh process and return its result, so
+    that memory measurements are not polluted by previous runs.
+    """
+    queue = multiprocessing.Queue()
+
+    def target():
+        queue.put(fun(*args))
+    p = multiprocessing.Process(target=target)
+    p.start()
+    result = queue.get()
+    p.join()
+    return result
+
+
+@contextlib.contextmanager
+def quiet():
+    """Swallow what is printed on stdout, e.g. ScriptBase's summary."""
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        yield
+    finally:
+        sys.stdout = stdout
+
+
+@contextlib.contextmanager
+def tmpdir(chdir=False):
+    """Yield a temporary directory, removed afterwards; if 'chdir' is
+    True it is also the working directory in the meantime.
+    """
+    path = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        if chdir:
+            os.chdir(path)
+        yield path
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def measure(fun, setup=None, repeat=None, warmup=None):
+    """Call fun() 'warmup' times and then 'repeat' times (by default
+    the -w and -r options) and return the list of the elapsed times of
+    the latter; setup(), if given, is called before each call and is
+    not timed.
+    """
+    if repeat is None:
+        repeat = options.repeat
+    if warmup is None:
+        warmup = options.warmup
+    times = []
+    for i in xrange(warmup + repeat):
+        if setup is not None:
+            setup()
+        t = time.time()
+        fun()
+        elapsed = time.time() - t
+        if i >= warmup:
+            times.append(elapsed)
+    return times
+
+
+def summarize(times):
+    """Return the statistics of a list of elapsed times."""
+    times = sorted(times)
+    n = len(times)
+    mean = sum(times) / n
+    if n % 2:
+        median = times[n // 2]
+    else:
+        median = (times[n // 2 - 1] + times[n // 2]) / 2
+    stdev = 0.0
+    if n > 1:
+        stdev = math.sqrt(sum([(t - mean) ** 2 for t in times]) / (n - 1))
+    return dict(runs=n, min=times[0], max=times[-1], mean=mean,
+                median=median, stdev=stdev)
+
+
+def report(name, times, work=1, unit='ops', **extra):
+    """Record and print the measurements of benchmark 'name': 'times'
+    are the elapsed times of runs processing 'work' units each; 'extra'
+    values (e.g. memory used) are recorded as they are.
+    """
+    result = summarize(times)
+    median = result['median']
+    result.update(work=work, unit=unit, rate=median and work / median or 0.0)
+    result.update(extra)
+    results[name] = result
+    line = "%-46s %9.4f secs +-%5.1f%% %12.1f %s/sec" \
+           % (name, median, median and result['stdev'] * 100 / median,
+              result['rate'], unit)
+    for key, value in sorted(extra.items()):
+        if isinstance(value, float):
+            value = "%0.2f" % value
+        line += " %s:%s" % (key, value)
+    print line
+    return result
+
+
+def compare(old, new):
+    """Return lines comparing the throughput of the benchmarks found
+    in both 'old' and 'new' results; a difference is only flagged when
+    it exceeds the noise of the measurements (their relative standard
+    deviations) and 2%.
+    """
+    lines = []
+    for name in sorted(set(old) & set(new)):
+        a, b = old[name], new[name]
+        if not a['rate'] or not b['rate']:
+            continue
+        ratio = b['rate'] / a['rate']
+        noise = max(a['stdev'] / a['median'] + b['stdev'] / b['median'],
+                    0.02)
+        if ratio > 1 + noise:
+            verdict = "faster"
+        elif ratio < 1 - noise:
+            verdict = "SLOWER"
+        else:
+            verdict = "same"
+        lines.append("%-46s %12.1f -> %12.1f %s/sec x%0.2f %s"
+                     % (name, a['rate'], b['rate'], b['unit'], ratio,
+                        verdict))
+    return lines
+
+
+def _metadata():
+    meta = dict(python=sys.version.split()[0], platform=sys.platform,
+                cpus=multiprocessing.cpu_count(),
+                time=time.strftime('%Y-%m-%d %H:%M:%S'),
+                repeat=options.repeat, warmup=options.warmup,
+                scale=options.scale)
+    try:
+        meta['commit'] = sh("cd %s && git rev-parse HEAD 2>/dev/null"
+                            % ROOT).strip()
+    except RuntimeError:
+        pass
+    return meta
+
+
+# --- fixtures
+
+def _names(n):
+    for i in xrange(n):
+        yield "Voornaam%s van Achternaam%s" % (i, i % 1000)
+
+
+def write_biographies(dir, n):
+    """Write 'n' synthetic biodes-like files into 'dir' and return
+    their total size in bytes.
+    """
+    total = 0
+    for i in xrange(n):
+        data = biography(i)
+        f = open(os.path.join(dir, "%s.xml" % i), 'w')
+        f.write(data)
+        f.close()
+        total += len(data)
+    return total
+
+
+def make_urls(n, distinct=20000, seed=0):
+    """Return 'n' synthetic URLs drawn from 'distinct' ones, about half
+    of them needing to be quoted, like the links of biographies.
+    """
+    rnd = random.Random(seed)
+    hosts = ['www.dbnl.org', 'resources.huygens.knaw.nl', 'nl.wikipedia.org',
+             'www.biografischportaal.nl', 'www.parlement.com']
+    pool = []
+    for i in xrange(distinct):
+        host = rnd.choice(hosts)
+        if i % 2:
+            pool.append('http://%s/auteurs/auteur.php?id=%s' % (host, i))
+        else:
+            pool.append(u'http://%s/wiki/Persoon %s (Begriffskl\xe4rung)'
+                        % (host, i))
+    return [rnd.choice(pool) for i in xrange(n)]
+
+
+# --- benchmarks
+
+# statements timed by bench_import(), from the cheapest
+IMPORTS = [
+    "import gerbrandyutils",
+    "from gerbrandyutils import hilite, sh",
+    "from gerbrandyutils import ScriptBase",
+    "from gerbrandyutils import *",
+]
+
+
+def _import_time(statement):
+    # time of 'statement' in a fresh interpreter (excluding its startup)
+    # and the number of modules it imports
+    code = ("import sys, time; n = len(sys.modules); t = time.time(); %s; "
+            "print time.time() - t, len(sys.modules) - n" % statement)
+    p = subprocess.Popen([sys.executable, '-c', code], cwd=ROOT,
+                         stdout=subprocess.PIPE)
+    elapsed, modules = p.communicate()[0].split()
+    return float(elapsed), int(modules)
+
+
+def bench_import():
+    """Time taken by importing gerbrandyutils in a fresh interpreter."""
+    for statement in IMPORTS:
+        times = []
+        for i in xrange(options.warmup + options.repeat * 4):
+            elapsed, modules = _import_time(statement)
+            if i >= options.warmup:
+                times.append(elapsed)
+        report("import: " + statement, times, unit='imports',
+               modules=modules)
+
+
+def bench_normalize_url(n=200000):
+    """normalize_url() per call against normalize_urls() in bulk."""
+    urls = make_urls(size(n))
+    assert list(normalize_urls(urls)) == [normalize_url(url) for url in urls]
+    report("normalize_url", measure(lambda: [normalize_url(url)
+                                             for url in urls]),
+           len(urls), 'urls')
+    report("normalize_urls cold cache",
+           measure(lambda: list(normalize_urls(urls)),
+                   setup=_url_caches.clear),
+           len(urls), 'urls')
+    report("normalize_urls warm cache",
+           measure(lambda: list(normalize_urls(urls))),
+           len(urls), 'urls')
+
+
+def bench_normalize_url_parallel(n=500000):
+    """normalize_url_file() scaling from 1 to N worker processes."""
+    n = size(n)
+    with tmpdir() as dir:
+        in_fn = os.path.join(dir, 'urls.txt')
+        out_fn = os.path.join(dir, 'out.txt')
+        f = open(in_fn, 'w')
+        for url in make_urls(n, distinct=n // 2 or 1):
+            if isinstance(url, unicode):
+                url = url.encode('utf-8')
+            f.write(url + '\n')
+        f.close()
+        workers = 1
+        while workers <= multiprocessing.cpu_count():
+            times = measure(lambda: normalize_url_file(in_fn, out_fn,
+                                                       workers))
+            report("normalize_url_file %s workers" % workers, times, n,
+                   'urls')
+            workers *= 2
+
+
+def bench_sh(n=50):
+    """Latency of spawning a command with sh() and sh_batch(), and
+    throughput of reading the output of a command with sh_iter().
+    """
+    n = size(n)
+    times = measure(lambda: [sh("true") for i in xrange(n)])
+    report("sh spawn", times, n, 'calls',
+           msecs=summarize(times)['median'] * 1000 / n)
+    report("sh_batch spawn 4 workers",
+           measure(lambda: list(sh_batch(["true"] * n, workers=4))),
+           n, 'calls')
+    lines = n * 20000
+    cmdline = "seq 1 %s" % lines
+    report("sh output", measure(lambda: sh(cmdline)), lines, 'lines')
+    report("sh_iter lines", measure(lambda: sum(1 for line in
+                                                sh_iter(cmdline))),
+           lines, 'lines')
+    report("sh_iter chunks", measure(lambda: list(sh_iter(cmdline, 65536))),
+           lines, 'lines')
+
+
+def bench_compress(n=5000):
+    """make_tarfile() throughput: gz against pgz by number of threads."""
+    with tmpdir() as dir:
+        in_dir = os.path.join(dir, 'out')
+        os.mkdir(in_dir)
+        mb = write_biographies(in_dir, size(n)) / 1024.0 / 1024
+        out_fn = os.path.join(dir, 'out.tar.gz')
+        runs = [('gz', 1)]
+        threads = 1
+        while threads <= multiprocessing.cpu_count():
+            runs.append(('pgz', threads))
+            threads *= 2
+        for compression, threads in runs:
+            times = measure(lambda: make_tarfile(in_dir, out_fn,
+                                                 compression=compression,
+                                                 threads=threads))
+            report("make_tarfile %s %s threads" % (compression, threads),
+                   times, mb, 'MB',
+                   ratio=os.path.getsize(out_fn) / 1024.0 / 1024 / mb)
+
+
+# ScriptBase configurations compared by bench_write_file()
+WRITE_FILE_VARIANTS = [
+    ('sync', {}),
+    ('writer_threads=4', dict(writer_threads=4)),
+    ('shard_depth=2', dict(shard_depth=2)),
+    ('stream_archive', dict(stream_archive=True, write_loose_files=False)),
+]
+
+
+def bench_write_file(n=5000):
+    """ScriptBase.write_file() throughput by configuration."""
+    documents = [Biodes(biography(i)) for i in xrange(size(n))]
+    with tmpdir(chdir=True):
+        for name, attributes in WRITE_FILE_VARIANTS:
+            attributes = dict(attributes, compress_on_exit=False)
+            cls = type('BenchScript', (ScriptBase,), attributes)
+            scripts = []
+
+            def setup():
+                scripts[:] = [cls()]
+
+            def run():
+                script = scripts[0]
+                for i, bdes in enumerate(documents):
+                    script.write_file(bdes, i)
+                with quiet():
+                    script._tear_down()
+            report("write_file " + name, measure(run, setup),
+                   len(documents), 'files')
+
+
+def _dedup_run(backend, n, dir):
+    os.chdir(dir)
+    script = type('BenchScript', (ScriptBase,),
+                  dict(dedup_backend=backend, compress_on_exit=False))()
+    before = rss()
+    t = time.time()
+    for name in _names(n):
+        script.name_already_processed(name)
+    script._lowercase_names.sync()
+    elapsed = time.time() - t
+    used = rss() - before
+    script._exited = True
+    script._lowercase_names.close()
+    return elapsed, used
+
+
+def bench_dedup(n=1000000):
+    """name_already_processed() by dedup backend: time and memory.
+    Each run is in a fresh process.
+    """
+    n = size(n)
+    with tmpdir() as dir:
+        for backend in ('set', 'fingerprint', 'sqlite'):
+            times = []
+            used = []
+            for i in xrange(options.repeat):
+                elapsed, memory = in_subprocess(_dedup_run, backend, n, dir)
+                times.append(elapsed)
+                used.append(memory)
+            report("name_already_processed %s" % backend, times, n, 'names',
+                   rss_mb=max(used) / 1024.0 / 1024)
+
+
+def _records_run(kind, n):
+    statuses = ['written', 'duplicate name', 'multiple of 7']
+    before = rss()
+    t = time.time()
+    if kind == 'list':
+        records = []
+        append = records.append
+    else:
+        records = RecordTable('id:p name:p status:s')
+        append = records.append
+    for i, name in enumerate(_names(n)):
+        append((unicode(i), name, statuses[i % 3]))
+    return time.time() - t, rss() - before
+
+
+def bench_records(n=1000000):
+    """Memory taken by per-record state: list of tuples vs RecordTable."""
+    n = size(n)
+    for kind in ('list', 'table'):
+        times = []
+        used = []
+        for i in xrange(options.repeat):
+            elapsed, memory = in_subprocess(_records_run, kind, n)
+            times.append(elapsed)
+            used.append(memory)
+        report("records %s" % kind, times, n, 'records',
+               rss_mb=max(used) / 1024.0 / 1024)
+
+
+def bench_run_io(n=200, hosts=4, latency=0.02):
+    """ScriptBase.run() against run_io() on records fetched over HTTP."""
+    records = [("host%s" % (i % hosts), i) for i in xrange(size(n))]
+    server = RepositoryServer(latency)
+    server.start()
+    fetch = fetcher(server.url)
+    runs = [('run', lambda script: script.run(records, fetch))]
+    for concurrency in (4, 16, 64):
+        runs.append(('run_io concurrency=%s' % concurrency,
+                     lambda script, c=concurrency: script.run_io(
+                         records, fetch, concurrency=c, per_host=c // hosts,
+                         host=lambda record: record[0])))
+    try:
+        with tmpdir(chdir=True):
+            cls = type('BenchScript', (ScriptBase,),
+                       dict(compress_on_exit=False))
+            base = None
+            for name, run in runs:
+                scripts = []
+
+                def setup():
+                    scripts[:] = [cls()]
+
+                def fun():
+                    with quiet():
+                        run(scripts[0])
+                        scripts[0]._tear_down()
+                times = measure(fun, setup)
+                rate = len(records) / summarize(times)['median']
+                if base is None:
+                    base = rate
+                report(name, times, len(records), 'records',
+                       speedup=rate / base)
+    finally:
+        server.stop()
+
+
+def _work():
+    # a small function calling another one, profiled by bench_profile()
+    return sum(range(20))
+
+
+def bench_profile(n=100000):
+    """Overhead of the @profile variants on a small function."""
+    n = size(n)
+    variants = [
+        ('plain', _work, n),
+        ('accumulate', profile(accumulate=True, filename=os.devnull)(_work),
+         n),
+        ('sample', profile(sample=True, filename=os.devnull)(_work), n),
+        # prints the stats on every call
+        ('default', profile(filename=os.devnull)(_work), n // 100 or 1),
+    ]
+    base = None
+    for name, fun, calls in variants:
+        times = measure(lambda: [fun() for i in xrange(calls)])
+        rate = calls / summarize(times)['median']
+        if base is None:
+            base = rate
+        report("profile " + name, times, calls, 'calls',
+               overhead=base / rate)
+
+
+BENCHMARKS = {
+    'import': bench_import,
+    'normalize_url': bench_normalize_url,
+    'normalize_url_parallel': bench_normalize_url_parallel,
+    'sh': bench_sh,
+    'compress': bench_compress,
+    'write_file': bench_write_file,
+    'dedup': bench_dedup,
+    'records': bench_records,
+    'profile': bench_profile,
+    'run_io': bench_run_io,
+}
+
+
+def main(args=None):
+    global options
+    parser = _parser()
+    options, names = parser.parse_args(args)
+    if options.list:
+        for name in sorted(BENCHMARKS):
+            print "%-24s %s" % (name, BENCHMARKS[name].__doc__.split("\n")[0])
+        return
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark %r" % name)
+    results.clear()
+    for name in names or sorted(BENCHMARKS):
+        BENCHMARKS[name]()
+    if options.output:
+        f = open(options.output, 'w')
+        try:
+            json.dump(dict(meta=_metadata(), results=results), f, indent=2,
+                      sort_keys=True)
+        finally:
+            f.close()
+    if options.compare:
+        f = open(options.compare)
+        try:
+            old = json.load(f)
+        finally:
+            f.close()
+        print "compared with %s" % old['meta'].get('commit', options.compare)
+        for line in compare(old['results'], results):
+            print line
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
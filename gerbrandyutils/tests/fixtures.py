@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+##########################################################################
+# Copyright (C) 2009 - 2014 Huygens ING & Gerbrandy S.R.L.
+#
+# This file is part of bioport.
+#
+# bioport is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/gpl-3.0.html>.
+##########################################################################
+
+"""
+Synthetic fixtures shared by the tests and the benchmarks: biodes-like
+documents and a local HTTP server standing in for the repositories of
+partners.
+"""
+
+import time
+import threading
+import urllib2
+import BaseHTTPServer
+import SocketServer
+
+from gerbrandyutils import Skip
+
+
+def biography(i):
+    """Return a synthetic biodes-like XML document."""
+    return ("<biodes><fileDesc><title>Biografie %s</title></fileDesc>"
+            "<person><persName>Voornaam%s van Achternaam%s</persName>"
+            "<event type='birth' when='17%02d'/></person>"
+            "<biography>%s</biography></biodes>"
+            % (i, i, i % 1000, i % 100, "Lorem ipsum %s. " % i * 50))
+
+
+class Biodes(object):
+    """A stand in for biodes documents as passed to write_file()."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def to_string(self):
+        return self.data
+
+    def to_file(self, filename):
+        f = open(filename, 'w')
+        try:
+            f.write(self.data)
+        finally:
+            f.close()
+
+
+class _RepositoryHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        host, n = self.path.strip('/').split('/')
+        # the request is active until the response is sent, as clients
+        # can send the next one as soon as they have it
+        self.server.enter(host)
+        try:
+            time.sleep(self.server.latency)
+        finally:
+            self.server.leave(host)
+        n = int(n)
+        if n % 7 == 0:
+            self.send_error(404)
+            return
+        data = biography(n)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class RepositoryServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """A local stand in for the repositories of partners, serving the
+    biography of record n of a host at /<host>/<n> after 'latency'
+    seconds (404 for multiples of 7). The maximum number of concurrent
+    requests per host and in total are kept in max_active.
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, latency=0.02):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           _RepositoryHandler)
+        self.latency = latency
+        self.url = 'http://127.0.0.1:%s' % self.server_port
+        self.active = {}
+        self.max_active = {}
+        self._lock = threading.Lock()
+
+    def enter(self, host):
+        self._lock.acquire()
+        try:
+            for key in (host, None):
+                self.active[key] = self.active.get(key, 0) + 1
+                self.max_active[key] = max(self.max_active.get(key, 0),
+                                           self.active[key])
+        finally:
+            self._lock.release()
+
+    def leave(self, host):
+        self._lock.acquire()
+        try:
+            for key in (host, None):
+                self.active[key] -= 1
+        finally:
+            self._lock.release()
+
+    def start(self):
+        t = threading.Thread(target=self.serve_forever)
+        t.setDaemon(True)
+        t.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+# never go through a proxy to reach the local server
+_opener = urllib2.build_opener(urllib2.ProxyHandler({}))
+
+
+def fetcher(url):
+    """Return a process_fn for ScriptBase.run() and run_io() fetching
+    (host, n) records from the RepositoryServer at 'url'.
+    """
+    def fetch(record):
+        host, n = record
+        try:
+            data = _opener.open('%s/%s/%s' % (url, host, n)).read()
+        except urllib2.HTTPError, err:
+            raise Skip("HTTP %s" % err.code)
+        return "%s-%s" % record, "Name %s" % (n % 30), Biodes(data)
+    return fetch
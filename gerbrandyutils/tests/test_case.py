@@ -23,13 +23,35 @@
 import unittest
 import time
 import threading
+import os
+import shutil
+import tempfile
+import sys
+import tarfile
+import json
+import warnings
+import random
+from StringIO import StringIO
 
 from gerbrandyutils import sh, normalize_url, hilite, run_in_thread
+from gerbrandyutils import ScriptBase, Skip, ProgressReporter, shard_path
+from gerbrandyutils import profile, sh_batch, sh_iter, normalize_urls
+from gerbrandyutils import normalize_urls_parallel, normalize_url_file
+from gerbrandyutils.cache import LRUCache, memoize
+from gerbrandyutils.sampling import SamplingProfiler
+from gerbrandyutils.dedup import SetIndex, FingerprintIndex, SqliteIndex
+from gerbrandyutils.writer import AsyncWriter, WriteError
+from gerbrandyutils.archive import make_tarfile, ParallelGzipFile
+from gerbrandyutils.archive import make_delta_tarfile, rebuild_tarfile
+from gerbrandyutils.timing import Timings
+from gerbrandyutils.threadpool import ThreadPool, TimeoutError, run_in_pool
+from gerbrandyutils.threadpool import HostLimiter
 from gerbrandyutils.compat import all, any, namedtuple
-try:
-    from gerbrandyutils import optimize
-except ImportError:
-    optimize = None
+from gerbrandyutils.records import RecordTable, row_class
+from gerbrandyutils import memory
+from gerbrandyutils.memory import MemoryMonitor, memory_info
+from gerbrandyutils.tests import fixtures
+from gerbrandyutils import optimize, psyco
 
 
 class TestCase(unittest.TestCase):
@@ -39,13 +61,173 @@ class TestCase(unittest.TestCase):
         self.assertTrue(stdout)
         self.assertRaises(RuntimeError, sh, 'badcmd')
           
+    def test_normalize_urls(self):
+        urls = [u'http://de.wikipedia.org/wiki/Elf (Begriffskl\xe4rung)',
+                'http://google.it', 'http://google.it?a=1&b=2',
+                'http://google.it?', 'HTTP://google.it', 'http://a/b#c',
+                'http://a/%41?q=%41', 'http://a/b?c=d/e+f', 'ftp://a/b c',
+                'http:////x', 'http:////', 'http://']
+        rnd = random.Random(0)
+        chars = "abAB09_.-/%:&=?#+ @~\xe4"
+        for i in range(2000):
+            urls.append("http://" + "".join(rnd.choice(chars)
+                                            for x in range(rnd.randint(0, 12))))
+        expected = [normalize_url(url) for url in urls]
+        self.assertEqual(list(normalize_urls(urls)), expected)
+        # again, from the cache
+        self.assertEqual(list(normalize_urls(urls)), expected)
+        self.assertEqual(list(normalize_urls(urls, cache_size=0)), expected)
+
+    def test_normalize_urls_parallel(self):
+        urls = ['http://a/%s %s' % (i, i % 3) for i in range(1000)]
+        expected = [normalize_url(url) for url in urls]
+        results = normalize_urls_parallel(iter(urls), workers=2, chunksize=7)
+        self.assertEqual(list(results), expected)
+        self.assertEqual(list(normalize_urls_parallel([], workers=2)), [])
+        output = StringIO()
+        count, elapsed, rate = normalize_url_file(
+            [url + '\n' for url in urls], output, workers=2, chunksize=100)
+        self.assertEqual(count, len(urls))
+        self.assertEqual(output.getvalue().splitlines(), expected)
+
+    def test_lru_cache(self):
+        cache = LRUCache(maxsize=3)
+        for key in "abcd":
+            cache.put(key, key.upper())
+        self.assertEqual(len(cache), 3)
+        self.assertFalse("a" in cache)
+        self.assertEqual(cache.get("b"), "B")
+        cache.put("e", "E")  # evicts "c"
+        self.assertEqual(cache.get("c", 0), 0)
+        self.assertEqual(cache.pop("b"), "B")
+        cache.put("b", 1)
+        self.assertEqual([cache.get(k) for k in "bde"], [1, "D", "E"])
+        self.assertEqual((cache.hits, cache.misses, cache.evictions),
+                         (4, 1, 2))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_record_table(self):
+        table = RecordTable([('id', 'l'), ('name', 'p'), ('source', 's'),
+                             ('score', 'd')], typename='Person')
+        rows = [(i, i % 3 and u"Naam %s \xe9" % i or None, "src%s" % (i % 4),
+                 i / 2.0) for i in range(100)]
+        table.extend(rows)
+        table.append((100, "bytes", None, 0.5))
+        rows.append((100, "bytes", None, 0.5))
+        self.assertEqual(len(table), 101)
+        self.assertEqual(list(table), rows)
+        self.assertEqual(table[-1], rows[-1])
+        self.assertEqual(table[3].name, None)
+        self.assertEqual(type(table[1].name), unicode)
+        self.assertEqual(type(table[-1].name), str)
+        self.assertRaises(IndexError, table.__getitem__, 101)
+        self.assertEqual([row.id for row in table.filter(source="src1",
+                                                          name=u"Naam 5 \xe9")],
+                         [5])
+        self.assertEqual(len(list(table.filter(lambda row: row.score > 45,
+                                               source="src2"))), 2)
+        self.assertEqual(list(table.filter(source="missing")), [])
+        table.update(0, source="src1", score=-1.0)
+        self.assertEqual(table[0], (0, None, "src1", -1.0))
+        self.assertEqual(list(table.column('source')).count("src1"), 26)
+        self.assertRaises(TypeError, table.update, 0, name="x")
+        self.assertRaises(ValueError, table.update, 0, missing=1)
+        self.assertRaises(ValueError, table.append, (1, "x"))
+        # a rejected value leaves the table as it was
+        self.assertRaises(TypeError, table.append, (101, "x", "src", "bad"))
+        self.assertRaises(TypeError, table.append, (101, 42, "src", 1.0))
+        table.append((101, "last", "src3", 1.0))
+        self.assertEqual(len(table), 102)
+        self.assertEqual(table[-1], (101, "last", "src3", 1.0))
+        self.assertEqual(table[-2], (100, "bytes", None, 0.5))
+        self.assertRaises(ValueError, RecordTable, 'id:x')
+        # row classes are created once per signature
+        self.assert_(RecordTable('id:l name:p').row is
+                     row_class('Record', ['id', 'name']))
+
+    def test_memoize(self):
+        calls = []
+
+        @memoize(maxsize=2, ttl=0.05)
+        def upper(s):
+            calls.append(s)
+            return s.upper()
+
+        self.assertEqual([upper(x) for x in "aaba"], list("AABA"))
+        self.assertEqual(calls, ["a", "b"])
+        upper("c")  # evicts "b"
+        time.sleep(0.06)
+        upper("a")  # expired
+        info = upper.cache_info()
+        self.assertEqual((info.hits, info.misses, info.evictions,
+                          info.expirations, info.size, info.maxsize),
+                         (2, 4, 1, 1, 2, 2))
+        upper.cache_clear()
+        self.assertEqual(upper.cache_info().size, 0)
+
+        @memoize(thread_safe=True)
+        def square(x):
+            return x * x
+
+        results = list(run_in_pool(workers=8)(square).map(range(200) * 5))
+        self.assertEqual(results, [x * x for x in range(200)] * 5)
+        info = square.cache_info()
+        self.assertEqual(info.hits + info.misses, 1000)
+        self.assertEqual(info.size, 200)
+
+    def test_sh_iter(self):
+        lines = sh_iter("seq 1 100000; seq 1 100000 >&2")
+        self.assertEqual(lines.next(), "1\n")
+        warnings.simplefilter("ignore", RuntimeWarning)
+        try:
+            self.assertEqual(sum(1 for line in lines), 99999)
+        finally:
+            warnings.resetwarnings()
+        chunks = list(sh_iter("seq 1 1000", chunksize=100))
+        self.assertEqual(len(chunks[0]), 100)
+        self.assertEqual("".join(chunks), sh("seq 1 1000"))
+        lines = sh_iter("echo a; badcmd")
+        self.assertEqual(lines.next(), "a\n")
+        self.assertRaises(RuntimeError, list, lines)
+        lines = sh_iter("yes")
+        self.assertEqual(lines.next(), "y\n")
+        lines.close()  # kills the command
+        # the children of the shell are killed too
+        lines = sh_iter("echo a; sleep 10; echo b")
+        self.assertEqual(lines.next(), "a\n")
+        time.sleep(0.2)  # let the shell start sleep
+        t = time.time()
+        lines.close()
+        self.assertTrue(time.time() - t < 5)
+
+    def test_sh_batch(self):
+        cmdlines = ["sleep 0.%s; echo %s" % (9 - i, i) for i in range(10)]
+        cmdlines += ["badcmd", "echo warn >&2", "sleep 10"]
+        t = time.time()
+        results = list(sh_batch(cmdlines, workers=20, timeout=1))
+        self.assertTrue(time.time() - t < 5)
+        by_cmdline = dict((r.cmdline, r) for r in results)
+        self.assertEqual(len(by_cmdline), len(cmdlines))
+        # yielded as they finish
+        self.assertEqual(results[-1].cmdline, "sleep 10")
+        self.assertEqual(by_cmdline[cmdlines[3]].check(), "3\n")
+        self.assertRaises(RuntimeError, by_cmdline["badcmd"].check)
+        self.assertTrue(by_cmdline["sleep 10"].timed_out)
+        self.assertRaises(RuntimeError, by_cmdline["sleep 10"].check)
+        warnings.simplefilter("error", RuntimeWarning)
+        try:
+            self.assertRaises(RuntimeWarning, by_cmdline["echo warn >&2"].check)
+        finally:
+            warnings.resetwarnings()
+
     def test_normalize_url(self):
         nu = normalize_url
         self.assertEqual(nu('http://google.it'), 'http://google.it')
         self.assertEqual(nu('http://google.it?a=1&b=2'), 'http://google.it?a=1&b=2')
 
-    if optimize is not None:
-        def test_optimize(self):
+    if psyco is not None:
+        def test_optimize_psyco(self):
 
             def foo():
                 L = []
@@ -66,12 +248,254 @@ class TestCase(unittest.TestCase):
                 foo()
             optimized_time = time.time() - t1
             self.assertTrue(optimized_time < normal_time)
+
+    def test_optimize(self):
+        calls = []
+
+        @optimize(backend='memoize', maxsize=2)
+        def double(x, y=1):
+            calls.append(x)
+            return x * 2 * y
+
+        self.assertEqual([double(x) for x in (1, 1, 2, 1, 3, 1)],
+                         [2, 2, 4, 2, 6, 2])
+        # 1 is recently used when 3 gets in, 2 is evicted
+        self.assertEqual(calls, [1, 2, 3])
+        self.assertEqual(double(2), 4)
+        self.assertEqual(double(1, y=2), 4)
+        self.assertEqual(calls, [1, 2, 3, 2, 1])
+        self.assertEqual(double.cache_info().hits, 3)
+
+        def foo():
+            return 1
+        self.assertTrue(optimize(foo, backend='none') is foo)
+        self.assertEqual(optimize(foo)(), 1)
+        self.assertRaises(ValueError, optimize, foo, backend='bad')
+        # options not accepted by the backend
+        self.assertRaises(ValueError, optimize, foo, maxsize=10)
+        self.assertRaises(ValueError, optimize, foo, backend='none', x=1)
+        self.assertRaises(ValueError, optimize, foo, backend='memoize',
+                          size=10)
             
+    def test_sampling_profiler(self):
+        def busy():
+            t = time.time()
+            while time.time() - t < 0.3:
+                sum(range(100))
+        profiler = SamplingProfiler(interval=0.005)
+        with profiler:
+            busy()
+        self.assertTrue(profiler.total() > 0)
+        self.assertTrue(profiler.collapsed()[0].split(";")[-1]
+                        .startswith("busy"))
+        stream = StringIO()
+        profiler.dump(stream)
+        self.assertEqual(len(stream.getvalue().splitlines()),
+                         len(profiler.samples))
+
+        @profile(sample=True, filename=os.devnull)
+        def sampled():
+            busy()
+            return 1
+        self.assertEqual(sampled(), 1)
+
+    def test_profile_accumulate(self):
+        @profile(accumulate=True, filename=os.devnull)
+        def fib(n):
+            if n < 2:
+                return n
+            return fib(n - 1) + fib(n - 2)
+
+        for i in range(100):
+            fib(5)
+        threads = [threading.Thread(target=fib, args=(5,)) for x in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stats = fib.print_stats()
+        calls = [v[:2] for k, v in stats.stats.items() if k[2] == 'fib']
+        # (primitive calls, total calls)
+        self.assertEqual(calls, [(103, 103 * 15)])
+
+    def test_host_limiter(self):
+        limiter = HostLimiter(per_host=2, delay=0.01)
+        lock = threading.Lock()
+        active = {}
+        peaks = {}
+        starts = []
+
+        def call(host):
+            limiter.acquire(host)
+            try:
+                lock.acquire()
+                active[host] = active.get(host, 0) + 1
+                peaks[host] = max(peaks.get(host, 0), active[host])
+                if host == 'a':
+                    starts.append(time.time())
+                lock.release()
+                time.sleep(0.02)
+                lock.acquire()
+                active[host] -= 1
+                lock.release()
+            finally:
+                limiter.release(host)
+        pool = ThreadPool(8)
+        list(pool.map(call, ['a', 'b'] * 6))
+        pool.shutdown()
+        self.assertEqual(peaks, dict(a=2, b=2))
+        starts.sort()
+        self.assertTrue(min([b - a for a, b in zip(starts, starts[1:])])
+                        >= 0.009)
+
+    def test_run_in_pool(self):
+        @run_in_pool(workers=3)
+        def foo(x):
+            if x < 0:
+                raise ValueError(x)
+            time.sleep(0.01)
+            return x * 2, threading.current_thread()
+
+        futures = [foo(i) for i in range(20)]
+        results = [f.result() for f in futures]
+        self.assertEqual([r[0] for r in results], range(0, 40, 2))
+        self.assertTrue(len(set(r[1] for r in results)) <= 3)
+        self.assertEqual([r[0] for r in foo.map(range(10))], range(0, 20, 2))
+        f = foo(-1)
+        self.assertTrue(isinstance(f.exception(), ValueError))
+        self.assertRaises(ValueError, f.result)
+        done = []
+        f.add_done_callback(done.append)
+        self.assertEqual(done, [f])
+
+    def test_thread_pool(self):
+        pool = ThreadPool(workers=2)
+        event = threading.Event()
+        f = pool.submit(event.wait)
+        self.assertRaises(TimeoutError, f.result, 0.01)
+        self.assertFalse(f.done())
+        event.set()
+        f.result(1)
+        pool.shutdown()
+        self.assertRaises(RuntimeError, pool.submit, time.time)
+
+    def test_timings(self):
+        timings = Timings()
+
+        @timings.timed()
+        def parse(x):
+            time.sleep(0.01)
+            return x
+        for i in range(3):
+            self.assertEqual(parse(i), i)
+        with timings.timer('write'):
+            pass
+        timings.count('records', 3)
+        self.assertEqual(timings['parse'].calls, 3)
+        self.assertTrue(timings['parse'].total >= 0.03)
+        self.assertEqual(sum(timings['parse'].histogram), 3)
+        report = timings.report(1.0)
+        self.assertTrue(report[0].startswith("parse"))
+        self.assertEqual(report[-1].split(), ["records", "3"])
+        data = timings.as_dict()
+        self.assertEqual(data['stages']['write']['calls'], 1)
+        self.assertEqual(data['counters'], {'records': 3})
+        # each call falls in the first bucket whose bound is >= its time
+        timings = Timings(thread_safe=False)
+        for elapsed in (0, 0.000001, 0.000002, 0.000004, 0.0000041, 10 ** 6):
+            timings.add('io', elapsed)
+        histogram = timings['io'].histogram
+        self.assertEqual(histogram[:3], [2, 2, 1])
+        self.assertEqual(histogram[-1], 1)
+
+    def test_memory_monitor(self):
+        info = memory_info()
+        self.assertTrue(info.rss > 0)
+        self.assertTrue(info.vms >= 0)
+        self.assertTrue(info.peak >= info.rss)
+        # samples are taken by hand, the sampler thread never wakes up
+        monitor = MemoryMonitor(interval=3600)
+        monitor.start()
+        with monitor.stage('parse'):
+            data = ["x" * 1000 for i in range(10000)]
+            monitor.sample()
+            with monitor.stage('write'):
+                monitor.sample()
+            monitor.sample()
+        # a spike between two samples is caught by the high water mark
+        with monitor.stage('spike'):
+            info = memory_info()
+            spike = "x" * (info.peak - info.rss + 30 * 1024 * 1024)
+            del spike
+            monitor.sample()
+        self.assertTrue(monitor['spike'].peak >= info.peak + 20 * 1024 * 1024)
+        self.assertEqual(monitor.peak, monitor['spike'].peak)
+        # stages of other threads are not tracked
+        t = threading.Thread(target=lambda: monitor.stage('other').__enter__())
+        t.start()
+        t.join()
+        monitor.stop()
+        self.assertEqual(monitor['parse'].samples, 2)
+        self.assertEqual(monitor['write'].samples, 1)
+        self.assertEqual(monitor['(other)'].samples, 1)
+        self.assertFalse('other' in monitor)
+        self.assertTrue(monitor['parse'].growth > 1000000)
+        self.assertTrue(monitor.peak >= monitor['parse'].peak > 0)
+        report = monitor.report()
+        self.assertTrue(report[0].startswith("peak rss:"))
+        self.assertTrue(report[1].startswith("parse"))
+        data = monitor.as_dict()
+        self.assertEqual(sorted(data['stages']),
+                         ['(other)', 'parse', 'spike', 'write'])
+        self.assertEqual(data['stages']['parse']['top'], [])
+        # without /proc only the peak is known
+        proc_status = memory._PROC_STATUS
+        memory._PROC_STATUS = '/nonexistent'
+        try:
+            info = memory_info()
+            self.assertEqual((info.rss, info.vms), (None, None))
+            self.assertTrue(info.peak > 0)
+            monitor = MemoryMonitor(interval=3600)
+            monitor.start()
+            with monitor.stage('parse'):
+                monitor.sample()
+            monitor.stop()
+        finally:
+            memory._PROC_STATUS = proc_status
+        self.assertTrue(monitor.peak > 0)
+        self.assertTrue("growth:n/a" in monitor.report()[1])
+        self.assertEqual(monitor.as_dict()['stages']['parse']['growth'], None)
+
     def test_hilite(self):
         hilite("foo", ok=1)
         hilite("foo", ok=1, bold=1)
         hilite("foo", ok=0)
         hilite("foo", ok=0, bold=1)
+        # stdout is checked on every call
+        stdout = sys.stdout
+        try:
+            sys.stdout = StringIO()
+            self.assertEqual(hilite("foo"), "foo")
+            sys.stdout.isatty = lambda: True
+            self.assertEqual(hilite("foo", ok=0), "\x1b[31mfoo\x1b[0m")
+        finally:
+            sys.stdout = stdout
+
+    def test_lazy_import(self):
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        code = ("import sys, gerbrandyutils; "
+                "print 'gerbrandyutils.script' in sys.modules, "
+                "'tarfile' in sys.modules; "
+                "from gerbrandyutils import *; "
+                "print ScriptBase.__name__, normalize_url.__name__")
+        out = sh("cd %s && %s -c \"%s\"" % (root, sys.executable, code))
+        self.assertEqual(out.split("\n")[:2],
+                         ["False False", "ScriptBase normalize_url"])
+        import gerbrandyutils
+        for name in gerbrandyutils.__all__:
+            self.assert_(hasattr(gerbrandyutils, name), name)
+            self.assert_(name in dir(gerbrandyutils), name)
         
     def test_compat_all(self):
         self.assertTrue(all([1, 1, 1, 1]))
@@ -105,9 +529,546 @@ class TestCase(unittest.TestCase):
         self.assertEqual(flag, [None])
 
 
+class FakeBiodes(object):
+    """Mimics the bits of a biodes document used by ScriptBase."""
+
+    def __init__(self, id):
+        self.id = id
+
+    def to_string(self):
+        return "<biodes id='%s'/>" % self.id
+
+    def to_file(self, filename):
+        f = open(filename, 'w')
+        f.write(self.to_string())
+        f.close()
+
+
+def process_record(n):
+    # module level so that it can be pickled by ScriptBase.run()
+    if n % 7 == 0:
+        raise Skip("multiple of 7")
+    if n % 11 == 0:
+        return None
+    return n, "Name %s" % (n % 30), FakeBiodes(n)
+
+
+class Script(ScriptBase):
+    compress_on_exit = False
+
+
+class KeepingScript(Script):
+    keep_records = True
+
+
+class ScriptBaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def read_output(self, dir='out'):
+        files = {}
+        for root, dirs, names in os.walk(dir):
+            for name in names:
+                files[name] = open(os.path.join(root, name)).read()
+        return files
+
+    def run_script(self, records, process_fn, cls=Script, method='run',
+                   **kwargs):
+        script = cls()
+        getattr(script, method)(records, process_fn, **kwargs)
+        script._tear_down()
+        return script
+
+    def test_run_parallel(self):
+        records = range(1, 200)
+        serial = self.run_script(records, process_record)
+        serial_files = self.read_output()
+        parallel = self.run_script(records, process_record, workers=3,
+                                   chunksize=4)
+        self.assertEqual(self.read_output(), serial_files)
+        self.assertEqual(parallel.total, len(records))
+        for attr in ('_imported', '_skipped', '_skip_reasons'):
+            self.assertEqual(getattr(parallel, attr), getattr(serial, attr))
+        self.assertEqual(parallel._imported, len(serial_files))
+
+    def test_run_parallel_lazily(self):
+        consumed = []
+
+        def records():
+            for n in range(1, 2000):
+                consumed.append(n)
+                yield n
+
+        class LazyScript(Script):
+            def write_file(self, bdes, id):
+                if not hasattr(self, 'consumed_on_write'):
+                    self.consumed_on_write = len(consumed)
+                Script.write_file(self, bdes, id)
+        script = self.run_script(records(), process_record, cls=LazyScript,
+                                 workers=2, chunksize=4)
+        # two chunks per worker, plus the one being read
+        self.assertTrue(script.consumed_on_write <= 2 * 2 * 4 + 4)
+        self.assertEqual(script._imported + script._skipped, 1999)
+
+    def read_archive(self, filename):
+        tar = tarfile.open(filename)
+        try:
+            return dict((m.name, tar.extractfile(m).read())
+                        for m in tar.getmembers())
+        finally:
+            tar.close()
+
+    def test_compress_on_exit(self):
+        script = ScriptBase()
+        script.run(range(1, 50), process_record)
+        script._tear_down()
+        self.assertEqual(self.read_archive('out.tar.gz'), self.read_output())
+
+    def test_stream_archive(self):
+        class StreamingScript(Script):
+            stream_archive = True
+            write_loose_files = False
+        script = StreamingScript()
+        script.run(range(1, 50), process_record)
+        script._tear_down()
+        self.assertEqual(os.listdir('out'), [])
+        members = self.read_archive('out.tar.gz')
+        self.assertEqual(len(members), script._imported)
+        self.assertEqual(members['1.xml'], FakeBiodes(1).to_string())
+
+    def test_dedup_backends(self):
+        names = ["name %s" % i for i in range(5000)] + [u'Jan Bos\xe9']
+        for index in (SetIndex(), FingerprintIndex(capacity=16),
+                      SqliteIndex('names.db', sync_every=100)):
+            for name in names:
+                self.assertFalse(name in index)
+                index.add(name)
+                index.add(name)
+                self.assertTrue(name in index)
+            self.assertEqual(len(index), len(names))
+            self.assertFalse("name -1" in index)
+            index.close()
+        index = SqliteIndex('names.db')
+        self.assertTrue(names[0] in index)
+        self.assertEqual(len(index), len(names))
+        index.close()
+
+    def test_invalid_configuration(self):
+        class BadScript(Script):
+            resume = True
+            stream_archive = True
+            memory_interval = 0.01
+        threads = threading.active_count()
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            self.assertRaises(ValueError, BadScript)
+            # the half built script has nothing to tear down
+            self.assertEqual(sys.stderr.getvalue(), "")
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_resume(self):
+        class CheckpointedScript(Script):
+            checkpoint = True
+            checkpoint_interval = 10
+        records = range(1, 200)
+        reference = self.run_script(records, process_record, key=int)
+        reference_files = self.read_output()
+
+        def crash_at_150(n):
+            if n == 150:
+                raise KeyboardInterrupt
+            return process_record(n)
+        script = CheckpointedScript()
+        self.assertRaises(KeyboardInterrupt, script.run, records,
+                          crash_at_150, key=int)
+        script._exited = True  # a crash: no tear down
+        self.assertTrue(140 <= len(script._done) < 150)
+
+        CheckpointedScript.resume = True
+        processed = []
+
+        def process(n):
+            processed.append(n)
+            return process_record(n)
+        script = CheckpointedScript()
+        script.run(records, process, key=int)
+        script._tear_down()
+        self.assertTrue(len(processed) <= 60)
+        self.assertEqual(self.read_output(), reference_files)
+        for attr in ('_imported', '_skipped'):
+            self.assertEqual(getattr(script, attr), getattr(reference, attr))
+        self.assertEqual(script._skip_reasons, reference._skip_reasons)
+        self.assertEqual(script.skip_report(), reference.skip_report())
+
+    def test_resume_after_failed_record(self):
+        class BrokenBiodes(FakeBiodes):
+            def to_file(self, filename):
+                raise IOError("disk full")
+
+        for backend in ('set', 'sqlite'):
+            class CheckpointedScript(Script):
+                checkpoint = True
+                dedup_backend = backend
+            names = "abc"
+            script = CheckpointedScript()
+            self.assertRaises(IOError, script.run, range(3),
+                              lambda n: (n, names[n], n == 1 and
+                                         BrokenBiodes(n) or FakeBiodes(n)),
+                              key=int)
+            # the half processed record is not journaled on tear down
+            script._tear_down()
+            events = [json.loads(line) for line in open('out.journal')]
+            self.assertEqual(events, [["nb", "a"], ["w", "0"]])
+
+            CheckpointedScript.resume = True
+            script = CheckpointedScript()
+            script.run(range(3), lambda n: (n, names[n], FakeBiodes(n)),
+                       key=int)
+            script._tear_down()
+            self.assertEqual(sorted(self.read_output()),
+                             ['0.xml', '1.xml', '2.xml'])
+            self.assertEqual(script._skipped, 0)
+            for name in ('out', 'out.journal', 'out.tar.gz', 'names.db'):
+                Script.safe_remove(name)
+
+    def test_resume_truncated_journal(self):
+        class CheckpointedScript(Script):
+            checkpoint = True
+            resume = True
+            checkpoint_interval = 1
+        os.mkdir('out')
+        for n in range(2):
+            FakeBiodes(n).to_file('out/%s.xml' % n)
+        f = open('out.journal', 'w')
+        f.write('["nb", "name 0"]\n["w", "0"]\n["nb", "name 1"]\n["w", "1')
+        f.close()
+        for records in (range(3), range(4)):
+            script = CheckpointedScript()
+            script.run(records, lambda n: (n, "name %s" % n, FakeBiodes(n)),
+                       key=int)
+            script._tear_down()
+        # each resume started from a well formed journal
+        lines = open('out.journal').read().splitlines()
+        self.assertEqual([json.loads(line) for line in lines][:2],
+                         [["nb", "name 0"], ["w", "0"]])
+        self.assertEqual(script._imported, 4)
+        self.assertEqual(script._skipped, 0)
+        self.assertEqual(sorted(self.read_output()),
+                         ['0.xml', '1.xml', '2.xml', '3.xml'])
+
+    def test_resume_after_failed_async_write(self):
+        class CheckpointedScript(Script):
+            checkpoint = True
+            writer_threads = 1
+
+        def process(n):
+            if n > 1:
+                time.sleep(0.1)  # let the write of 1.xml fail
+            return n, "name %s" % n, FakeBiodes(n)
+        script = CheckpointedScript()
+        os.mkdir('out/1.xml')  # can't be replaced by a file
+        # raised by the write of a later file
+        self.assertRaises(WriteError, script.run, range(5), process, key=int)
+        script._tear_down()
+        events = [json.loads(line) for line in open('out.journal')]
+        self.assertFalse(["w", "1"] in events)
+        self.assertFalse(os.path.exists('out/1.xml'))  # removed on failure
+
+        open('out/4.xml.123-456.tmp', 'w').close()  # left by a kill
+        CheckpointedScript.resume = True
+        script = CheckpointedScript()
+        script.run(range(5), process, key=int)
+        script._tear_down()
+        self.assertEqual(sorted(self.read_output()),
+                         ['%s.xml' % n for n in range(5)])
+        self.assertEqual(script._imported, 5)
+
+    def test_progress_reporter(self):
+        p = ProgressReporter(interval=1, every=0)
+        t = p.started
+        self.assertFalse(p.update(10, t + 0.5))
+        self.assertTrue(p.update(20, t + 1))
+        self.assertEqual(p.rate, 20)
+        self.assertTrue(p.update(60, t + 2))
+        self.assertEqual(p.rate, 0.3 * 40 + 0.7 * 20)
+        self.assertEqual(p.eta(60, 60), None)
+        self.assertTrue(ProgressReporter(0, 0).update(1))
+
+    def test_print_progress(self):
+        class QuietScript(Script):
+            progress_interval = 0
+            progress_every = 50
+        script = QuietScript()
+        script.run(range(1, 200), process_record)
+        script._tear_down()
+        lines = [x for x in sys.stdout.getvalue().splitlines()
+                 if x.startswith("processing:")]
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith("processing: 50/199"))
+        self.assertTrue("imported:" in lines[0])
+
+    def test_async_writer(self):
+        writer = AsyncWriter(threads=3, maxsize=5)
+        for i in range(50):
+            writer.write("%s.xml" % i, str(i))
+        writer.drain()
+        self.assertEqual(open("49.xml").read(), "49")
+        writer.write("missing/1.xml", "1")
+        self.assertRaises(WriteError, writer.drain)
+        writer.write("missing/2.xml", "2")
+        errors = writer.close()
+        self.assertEqual([e.filename for e in errors], ["missing/2.xml"])
+        self.assertEqual(sorted(os.listdir('.')),
+                         sorted("%s.xml" % i for i in range(50)))
+        self.assertRaises(ValueError, writer.write, "1.xml", "1")
+
+    def test_write_file_in_background(self):
+        class ThreadedScript(Script):
+            writer_threads = 4
+            writer_queue_size = 10
+        self.run_script(range(1, 200), process_record)
+        files = self.read_output()
+        self.run_script(range(1, 200), process_record, ThreadedScript)
+        self.assertEqual(self.read_output(), files)
+
+        class Broken(object):
+            def to_string(self):
+                return "x"
+        script = ThreadedScript()
+        script.write_file(FakeBiodes(1), 1)
+        script.write_file(Broken(), "missing/2")
+        self.assertRaises(WriteError, script._tear_down)
+        self.assertEqual(script._imported, 1)
+        self.assertEqual(os.listdir('out'), ['1.xml'])
+
+    def test_sharded_output(self):
+        class ShardedScript(ScriptBase):
+            shard_depth = 2
+        self.assertEqual(shard_path('123.xml', 1, 3), '98e/123.xml')
+        script = ShardedScript()
+        script.run(range(1, 50), process_record)
+        script._tear_down()
+        self.assertTrue(os.path.isfile(os.path.join('out',
+                                                    shard_path('1.xml'))))
+        self.assertFalse(os.path.exists(os.path.join('out', '1.xml')))
+        files = self.read_output()
+        self.assertEqual(len(files), script._imported)
+        self.assertEqual(self.read_archive('out.tar.gz'), files)
+        # unicode ids are hashed as UTF-8
+        self.assertEqual(shard_path(u'Bos\xe9.xml'), u'f2/88/Bos\xe9.xml')
+        script = ShardedScript()
+        self.assertEqual(script.output_path(u'Bos\xe9.xml'),
+                         u'out/f2/88/Bos\xe9.xml')
+        self.assertTrue(os.path.isdir('out/f2/88'))
+        script._tear_down()
+
+    def test_make_tarfile_compressions(self):
+        self.run_script(range(1, 100), process_record)
+        files = self.read_output()
+        for compression in ('gz', 'pgz', 'bz2', None):
+            make_tarfile('out', 'out.tar', compression=compression, level=1,
+                         threads=3)
+            self.assertEqual(self.read_archive('out.tar'), files)
+
+    def test_parallel_gzip_file(self):
+        import gzip
+        data = "".join("<biodes id='%s'/>\n" % i for i in range(20000))
+        f = ParallelGzipFile('data.gz', threads=3, blocksize=1000)
+        for i in range(0, len(data), 777):
+            f.write(data[i:i + 777])
+        f.close()
+        self.assertEqual(gzip.open('data.gz').read(), data)
+        ParallelGzipFile('empty.gz').close()
+        self.assertEqual(gzip.open('empty.gz').read(), "")
+
+    def test_delta_tarfile(self):
+        self.run_script(range(1, 100), process_record)
+        changed, deleted = make_delta_tarfile('out', 'base.tar.gz',
+                                              'manifest')
+        self.assertEqual(len(changed), len(os.listdir('out')))
+        self.assertEqual(deleted, [])
+        FakeBiodes('2 changed').to_file('out/2.xml')
+        FakeBiodes(1000).to_file('out/1000.xml')
+        os.remove('out/3.xml')
+        os.utime('out/4.xml', (0, 0))  # touched but not changed
+        changed, deleted = make_delta_tarfile('out', 'delta1.tar.gz',
+                                              'manifest')
+        self.assertEqual(changed, ['1000.xml', '2.xml'])
+        self.assertEqual(deleted, ['3.xml'])
+        self.assertEqual(make_delta_tarfile('out', 'delta2.tar.gz',
+                                            'manifest'), ([], []))
+        rebuild_tarfile('base.tar.gz', ['delta1.tar.gz', 'delta2.tar.gz'],
+                        'full.tar.gz')
+        self.assertEqual(self.read_archive('full.tar.gz'), self.read_output())
+
+    def test_stage_timings(self):
+        class TimedScript(ScriptBase):
+            timings_filename = 'timings.json'
+        script = TimedScript()
+        with script.stage('parse'):
+            records = range(1, 50)
+        script.run(records, process_record)
+        script._tear_down()
+        stages = json.load(open('timings.json'))['stages']
+        self.assertEqual(sorted(stages), ['compress', 'dedup', 'parse',
+                                          'transform', 'write'])
+        self.assertEqual(stages['write']['calls'], script._imported)
+        self.assertTrue("stages:" in sys.stdout.getvalue())
+
+    def test_stages_off(self):
+        script = self.run_script(range(1, 50), process_record)
+        self.assertEqual(script.timings.stats, {})
+        self.assertFalse("stages:" in sys.stdout.getvalue())
+        with script.stage('parse'):
+            pass
+        self.assertEqual(script.timings.stats, {})
+
+        class TimedScript(Script):
+            time_stages = True
+        script = TimedScript()
+        # only the stages of the thread which created the script
+        t = threading.Thread(target=lambda: script.stage('other').__enter__())
+        t.start()
+        t.join()
+        script.run(range(1, 50), process_record)
+        script._tear_down()
+        self.assertEqual(sorted(script.timings.stats),
+                         ['compress', 'dedup', 'transform', 'write'])
+        self.assertTrue("stages:" in sys.stdout.getvalue())
+
+    def test_stage_memory(self):
+        class MeasuredScript(Script):
+            memory_interval = 0.001
+            memory_tracemalloc = True
+            memory_filename = 'memory.json'
+        warnings.simplefilter("ignore", RuntimeWarning)
+        try:
+            script = self.run_script(range(1, 200), process_record,
+                                     cls=MeasuredScript)
+        finally:
+            warnings.resetwarnings()
+        self.assertFalse(script.memory._sampler)
+        data = json.load(open('memory.json'))
+        self.assertTrue(data['peak'] >= data['rss'] > 0)
+        self.assertTrue(data['stages'])
+        self.assertTrue("memory:" in sys.stdout.getvalue())
+        self.assertEqual(Script().memory, None)
+
+    def test_keep_records(self):
+        script = self.run_script(range(1, 200), process_record,
+                                 cls=KeepingScript, key=int)
+        records = script.records
+        self.assertEqual(len(records), 199)
+        self.assertEqual(records[0], (u"1", "Name 1", "written"))
+        self.assertEqual(len(list(records.filter(status="written"))),
+                         script._imported)
+        self.assertEqual([r.id for r in records.filter(status="skipped")][:3],
+                         [u"11", u"22", u"33"])
+        self.assertEqual(records[30], (u"31", "Name 1", "duplicate name"))
+        self.assertEqual(Script().records, None)
+
+    def test_benchmarks(self):
+        # imported here as the other tests don't need it, from the
+        # directory the tests started in as the package path may be
+        # relative to it
+        os.chdir(self.cwd)
+        try:
+            from gerbrandyutils.tests import benchmarks
+        finally:
+            os.chdir(self.tmpdir)
+        args = ['-s', '0.001', '-r', '3', '-w', '0', 'write_file',
+                'normalize_url']
+        benchmarks.main(args + ['-o', 'before.json'])
+        saved = json.load(open('before.json'))
+        self.assertEqual(saved['results']['write_file sync']['runs'], 3)
+        self.assertEqual(saved['meta']['scale'], 0.001)
+        benchmarks.main(args + ['-c', 'before.json'])
+        self.assertTrue("normalize_url " in sys.stdout.getvalue())
+        self.assertTrue("compared with" in sys.stdout.getvalue())
+
+    def test_run_io(self):
+        server = fixtures.RepositoryServer(latency=0.01)
+        server.start()
+        try:
+            fetch = fixtures.fetcher(server.url)
+            records = [(host, n) for n in range(1, 40) for host in 'ab']
+            serial = self.run_script(records, fetch)
+            serial_files = self.read_output()
+            server.max_active.clear()
+            script = self.run_script(records, fetch, cls=KeepingScript,
+                                     method='run_io', concurrency=8,
+                                     per_host=2, host=lambda r: r[0])
+            self.assertEqual(self.read_output(), serial_files)
+            for attr in ('total', '_imported', '_skipped', '_skip_reasons'):
+                self.assertEqual(getattr(script, attr), getattr(serial, attr))
+            self.assertEqual(script.records[7], ("b-4", "Name 4",
+                                                  "duplicate name"))
+            self.assertEqual(script.records[12], (None, None, "HTTP 404"))
+            self.assertEqual(server.max_active['a'], 2)
+            self.assertEqual(server.max_active['b'], 2)
+            self.assertTrue(server.max_active[None] > 2)
+
+            def fail(record):
+                raise ValueError(record)
+            script = Script()
+            self.assertRaises(ValueError, script.run_io, records, fail)
+            script._tear_down()
+        finally:
+            server.stop()
+
+    def test_skip_report(self):
+        class ReportingScript(Script):
+            skip_sample_size = 3
+            skip_report_filename = 'skips.json'
+        script = self.run_script(range(1, 200), process_record,
+                                 cls=ReportingScript, key=int)
+        report = json.load(open('skips.json'))
+        self.assertEqual(report['skipped'], script._skipped)
+        self.assertEqual(report['reasons'], [
+            dict(reason="duplicate name", count=125,
+                 ids=["31", "32", "34"]),
+            dict(reason="multiple of 7", count=28, ids=["7", "14", "21"])])
+        self.assertTrue("(28) multiple of 7 ids: 7, 14, 21" in
+                        sys.stdout.getvalue())
+
+    def test_cache_report(self):
+        @memoize
+        def lookup(x):
+            return x
+        lookup(1)
+        lookup(1)
+        script = Script()
+        script._tear_down()
+        self.assertTrue(".lookup hits:1 misses:1 " in sys.stdout.getvalue())
+
+    def test_persistent_dedup(self):
+        class PersistentScript(Script):
+            dedup_backend = 'sqlite'
+        script = PersistentScript()
+        self.assertFalse(script.name_already_processed("Jan Bos"))
+        script._tear_down()
+        PersistentScript.remove_output_dir_on_start = False
+        script = PersistentScript()
+        self.assertTrue(script.name_already_processed("jan bos"))
+        script._tear_down()
+
+
 def test_suite():
     test_suite = unittest.TestSuite()
-    tests = [TestCase]
+    tests = [TestCase, ScriptBaseTestCase]
     for test in tests:
         test_suite.addTest(unittest.makeSuite(test))
     return test_suite
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+
+##########################################################################
+# Copyright (C) 2009 - 2014 Huygens ING & Gerbrandy S.R.L.
+#
+# This file is part of bioport.
+#
+# bioport is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/gpl-3.0.html>.
+##########################################################################
+
+"""
+A bounded, reusable pool of threads returning futures, to fan out
+I/O bound calls without starting a thread per call.
+
+>>> @run_in_pool
+... def fetch(x):
+...     return x * 2
+...
+>>> f = fetch(2)
+>>> f.result()
+4
+>>> list(fetch.map([1, 2, 3]))
+[2, 4, 6]
+"""
+
+__all__ = ["Future", "ThreadPool", "TimeoutError", "run_in_pool",
+           "default_pool", "HostLimiter"]
+
+import sys
+import time
+import atexit
+import threading
+import collections
+import multiprocessing
+import Queue
+
+
+class TimeoutError(Exception):
+    """Raised by Future.result() and Future.exception() on timeout."""
+
+
+class Future(object):
+    """The result of a call executed by a ThreadPool."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def done(self):
+        return self._event.isSet()
+
+    def _wait(self, timeout):
+        self._event.wait(timeout)
+        if not self._event.isSet():
+            raise TimeoutError()
+
+    def result(self, timeout=None):
+        """Return the value returned by the call, waiting at most
+        'timeout' seconds; re-raise the exception raised by the call.
+        """
+        self._wait(timeout)
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        """Return the exception raised by the call or None."""
+        self._wait(timeout)
+        if self._exc_info is not None:
+            return self._exc_info[1]
+
+    def add_done_callback(self, fn):
+        """Call fn(future) once done (immediately if already done)."""
+        self._lock.acquire()
+        try:
+            if not self.done():
+                self._callbacks.append(fn)
+                return
+        finally:
+            self._lock.release()
+        fn(self)
+
+    def _set(self, result=None, exc_info=None):
+        self._lock.acquire()
+        try:
+            self._result = result
+            self._exc_info = exc_info
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        finally:
+            self._lock.release()
+        for fn in callbacks:
+            fn(self)
+
+
+class ThreadPool(object):
+    """A pool of at most 'workers' threads (started on demand) fed by
+    a queue of at most 'maxsize' pending calls (0 means unbounded).
+    """
+
+    def __init__(self, workers=None, maxsize=0):
+        self.workers = workers or multiprocessing.cpu_count() * 5
+        self._queue = Queue.Queue(maxsize)
+        self._threads = []
+        self._idle = 0
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            try:
+                result = fn(*args, **kwargs)
+            except:
+                future._set(exc_info=sys.exc_info())
+            else:
+                future._set(result)
+            del item, future  # don't keep the last result alive
+            self._lock.acquire()
+            self._idle += 1
+            self._lock.release()
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule fn(*args, **kwargs) and return a Future."""
+        future = Future()
+        self._lock.acquire()
+        try:
+            if self._shutdown:
+                raise RuntimeError("pool has been shut down")
+            if self._idle:
+                self._idle -= 1
+            elif len(self._threads) < self.workers:
+                t = threading.Thread(target=self._work)
+                t.setDaemon(True)
+                t.start()
+                self._threads.append(t)
+        finally:
+            self._lock.release()
+        self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def map(self, fn, iterable):
+        """Like itertools.imap() but the calls are executed by the pool;
+        results are yielded in input order and at most twice as many
+        calls as workers are scheduled ahead.
+        """
+        pending = collections.deque()
+        for item in iterable:
+            pending.append(self.submit(fn, item))
+            if len(pending) >= self.workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def shutdown(self, wait=True):
+        """Stop accepting calls; if 'wait' is True wait for the pending
+        ones to complete.
+        """
+        self._lock.acquire()
+        try:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            threads = list(self._threads)
+        finally:
+            self._lock.release()
+        for t in threads:
+            self._queue.put(None)
+        if wait:
+            for t in threads:
+                t.join()
+
+
+class HostLimiter(object):
+    """Politeness towards remote hosts for the threads of a pool: at
+    most 'per_host' calls at a time to the same host, started at least
+    'delay' seconds apart.
+
+    >>> limiter = HostLimiter(per_host=2)
+    >>> limiter.acquire('www.dbnl.org')
+    >>> try:
+    ...     pass  # fetch something from www.dbnl.org
+    ... finally:
+    ...     limiter.release('www.dbnl.org')
+    """
+
+    def __init__(self, per_host=2, delay=0):
+        self.per_host = per_host
+        self.delay = delay
+        self._semaphores = {}
+        self._next_start = {}  # host -> time the next call can start
+        self._lock = threading.Lock()
+
+    def acquire(self, host):
+        """Wait until a call to 'host' can be made."""
+        self._lock.acquire()
+        try:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = self._semaphores[host] = \
+                    threading.BoundedSemaphore(self.per_host)
+        finally:
+            self._lock.release()
+        semaphore.acquire()
+        if self.delay:
+            self._lock.acquire()
+            try:
+                now = time.time()
+                start = max(now, self._next_start.get(host, now))
+                self._next_start[host] = start + self.delay
+            finally:
+                self._lock.release()
+            if start > now:
+                time.sleep(start - now)
+
+    def release(self, host):
+        """Signal that a call to 'host' has completed."""
+        self._semaphores[host].release()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def default_pool():
+    """Return the process wide pool used by @run_in_pool, which is
+    shut down (waiting for pending calls) at exit.
+    """
+    global _default_pool
+    _default_pool_lock.acquire()
+    try:
+        if _default_pool is None:
+            _default_pool = ThreadPool()
+            atexit.register(_default_pool.shutdown)
+        return _default_pool
+    finally:
+        _default_pool_lock.release()
+
+
+def run_in_pool(fn=None, workers=None, pool=None):
+    """Decorator to run a callable in a pool of threads returning a
+    Future. Can be used as @run_in_pool (the calls go to the default
+    pool), @run_in_pool(workers=N) (a dedicated pool of N threads) or
+    @run_in_pool(pool=pool).
+    The decorated callable has a map(iterable) attribute calling it on
+    every item in the pool and yielding the results in order.
+    """
+    def outer(fun):
+        if pool is not None:
+            get_pool = lambda: pool
+        elif workers is not None:
+            own_pool = ThreadPool(workers)
+            atexit.register(own_pool.shutdown)
+            get_pool = lambda: own_pool
+        else:
+            get_pool = default_pool
+
+        def inner(*args, **kwargs):
+            return get_pool().submit(fun, *args, **kwargs)
+
+        inner.map = lambda iterable: get_pool().map(fun, iterable)
+        inner.__name__ = fun.__name__
+        inner.__doc__ = fun.__doc__
+        return inner
+
+    if fn is not None:
+        return outer(fn)
+    return outer
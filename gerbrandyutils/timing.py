@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+##########################################################################
+# Copyright (C) 2009 - 2014 Huygens ING & Gerbrandy S.R.L.
+#
+# This file is part of bioport.
+#
+# bioport is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/gpl-3.0.html>.
+##########################################################################
+
+"""
+Lightweight wall time instrumentation: cumulative time, number of
+calls and latency histogram of named stages, plus plain counters.
+
+>>> timings = Timings()
+>>> with timings.timer('parse'):
+...     pass
+>>> @timings.timed('transform')
+... def transform(x):
+...     return x
+>>> transform(1)
+1
+>>> timings.count('records', 2)
+>>> timings['parse'].calls, timings['transform'].calls
+(1, 1)
+
+A process wide registry is available as gerbrandyutils.timing.timings
+together with the timer(), timed() and count() shortcuts.
+"""
+
+__all__ = ["Timings", "Stat", "timings", "timer", "timed", "count"]
+
+import time
+import json
+import bisect
+import threading
+
+# upper bounds (in seconds) of the latency histogram buckets: powers of
+# 4 from 1 microsecond to ~4.5 minutes, plus one for anything slower
+BUCKETS = [4 ** i / 1000000.0 for i in range(15)] + [float('inf')]
+
+
+class Stat(object):
+    """The measurements of a stage."""
+    __slots__ = ('calls', 'total', 'min', 'max', 'histogram')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.histogram = [0] * len(BUCKETS)
+
+    def add(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        if self.min is None or elapsed < self.min:
+            self.min = elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        # first bucket whose bound is >= elapsed
+        self.histogram[bisect.bisect_left(BUCKETS, elapsed)] += 1
+
+    @property
+    def mean(self):
+        return self.calls and self.total / self.calls or 0.0
+
+    def as_dict(self):
+        return dict(calls=self.calls, total=self.total, min=self.min,
+                    max=self.max, mean=self.mean,
+                    histogram=[(bound, n) for bound, n in
+                               zip(BUCKETS[:-1] + [None], self.histogram)
+                               if n])
+
+
+class _Timer(object):
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timings.add(self.name, time.time() - self.started)
+
+
+class Timings(object):
+    """A registry of stage timings and counters; with thread_safe=False
+    it must only be used by one thread at a time, but it is cheaper.
+    """
+
+    def __init__(self, thread_safe=True):
+        self.stats = {}
+        self.counters = {}
+        self._lock = thread_safe and threading.Lock() or None
+
+    def __getitem__(self, name):
+        return self.stats[name]
+
+    def __contains__(self, name):
+        return name in self.stats
+
+    def add(self, name, elapsed):
+        """Record a call to stage 'name' lasting 'elapsed' seconds."""
+        lock = self._lock
+        if lock is not None:
+            lock.acquire()
+        try:
+            stat = self.stats.get(name)
+            if stat is None:
+                stat = self.stats[name] = Stat()
+            stat.add(elapsed)
+        finally:
+            if lock is not None:
+                lock.release()
+
+    def timer(self, name):
+        """Return a context manager timing stage 'name'."""
+        return _Timer(self, name)
+
+    def timed(self, name=None):
+        """Decorator timing the calls to a callable as stage 'name'
+        (default: the name of the callable).
+        """
+        def outer(fun):
+            stage = name or fun.__name__
+
+            def inner(*args, **kwargs):
+                t = time.time()
+                try:
+                    return fun(*args, **kwargs)
+                finally:
+                    self.add(stage, time.time() - t)
+            inner.__name__ = fun.__name__
+            inner.__doc__ = fun.__doc__
+            return inner
+        return outer
+
+    def count(self, name, n=1):
+        """Increment counter 'name' by 'n'."""
+        lock = self._lock
+        if lock is not None:
+            lock.acquire()
+        try:
+            self.counters[name] = self.counters.get(name, 0) + n
+        finally:
+            if lock is not None:
+                lock.release()
+
+    def report(self, elapsed=None):
+        """Return the breakdown of the stages as a list of lines;
+        if 'elapsed' is given each stage is also shown as a percentage
+        of it.
+        """
+        lines = []
+        items = sorted(self.stats.items(), key=lambda x: -x[1].total)
+        for name, stat in items:
+            line = "%-12s calls:%-8s total:%0.3f secs mean:%0.6f max:%0.6f" \
+                   % (name, stat.calls, stat.total, stat.mean, stat.max)
+            if elapsed:
+                line += " (%0.1f%%)" % (stat.total * 100 / elapsed)
+            lines.append(line)
+        for name, value in sorted(self.counters.items()):
+            lines.append("%-12s %s" % (name, value))
+        return lines
+
+    def as_dict(self):
+        return dict(stages=dict((name, stat.as_dict())
+                                for name, stat in self.stats.items()),
+                    counters=dict(self.counters))
+
+    def dump_json(self, filename):
+        f = open(filename, 'w')
+        try:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+        finally:
+            f.close()
+
+
+timings = Timings()
+timer = timings.timer
+timed = timings.timed
+count = timings.count
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# coding=utf8
+
+##########################################################################
+# Copyright (C) 2009 - 2014 Huygens ING & Gerbrandy S.R.L.
+#
+# This file is part of bioport.
+#
+# bioport is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/gpl-3.0.html>.
+##########################################################################
+
+"""
+Normalization of URLs entered by users, one at a time or in bulk.
+"""
+
+__all__ = ["normalize_url", "normalize_urls", "normalize_urls_parallel",
+           "normalize_url_file"]
+
+import urllib
+import urlparse
+import sys
+import re
+import time
+import itertools
+import collections
+import multiprocessing
+
+from cache import LRUCache
+from progress import ProgressReporter
+
+
+def normalize_url(s, charset='utf-8'):
+    """Sometimes you get an URL by a user that just isn't a real
+    URL because it contains unsafe characters like ' ' and so on.  This
+    function can fix some of the problems in a similar way browsers
+    handle data entered by the user:
+
+    >>> normalize_url(u'http://de.wikipedia.org/wiki/Elf (Begriffsklärung)')
+    'http://de.wikipedia.org/wiki/Elf%20%28Begriffskl%C3%A4rung%29'
+
+    :param charset: The target charset for the URL if the url was
+                    given as unicode string.
+    """
+    if isinstance(s, unicode):
+        s = s.encode(charset, 'ignore')
+    scheme, netloc, path, qs, anchor = urlparse.urlsplit(s)
+    path = urllib.quote(path, '/%')
+    qs = urllib.quote_plus(qs, ':&=')
+    return urlparse.urlunsplit((scheme, netloc, path, qs, anchor))
+
+
+# URLs which normalize_url() returns unchanged: lowercase http(s) scheme,
+# non empty host (urlunsplit() drops the extra slashes of 'http:////x'),
+# path made of characters left alone by quote(path, '/%'), non empty
+# query made of characters left alone by quote_plus(qs, ':&=') and no
+# fragment
+_SAFE_URL = re.compile(r"https?://[A-Za-z0-9.:@-]+(/[A-Za-z0-9_./%-]*)?"
+                       r"(\?[A-Za-z0-9_.:&=-]+)?\Z")
+# charset -> LRUCache of normalized URLs
+_url_caches = {}
+
+
+def normalize_urls(urls, charset='utf-8', cache_size=100000):
+    """Normalize every URL in the iterable 'urls', yielding the same
+    results normalize_url() does but faster: URLs which are already
+    safe ASCII are returned as they are and the others are memoized
+    in an LRU cache of 'cache_size' items shared among calls.
+
+    >>> list(normalize_urls(['http://google.it', u'http://g.it/a b']))
+    ['http://google.it', 'http://g.it/a%20b']
+    """
+    cache = _url_caches.get(charset)
+    if cache is None:
+        cache = _url_caches[charset] = LRUCache(cache_size)
+    cache.maxsize = cache_size
+    match = _SAFE_URL.match
+    get = cache.get
+    put = cache.put
+    for url in urls:
+        if url.__class__ is str and match(url):
+            yield url
+            continue
+        result = get(url)
+        if result is None:
+            if isinstance(url, unicode):
+                result = url.encode(charset, 'ignore')
+            else:
+                result = url
+            if not match(result):
+                result = normalize_url(result, charset)
+            put(url, result)
+        yield result
+
+
+def _normalize_chunk(args):
+    # executed in the worker processes of normalize_urls_parallel()
+    urls, charset = args
+    return list(normalize_urls(urls, charset))
+
+
+def normalize_urls_parallel(urls, workers=None, chunksize=10000,
+                            charset='utf-8'):
+    """Like normalize_urls() but URLs are normalized in chunks of
+    'chunksize' by a pool of 'workers' processes (default: one per
+    CPU). Results are yielded in input order and 'urls' is consumed
+    lazily: at most two chunks per worker are in memory at any time.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    urls = iter(urls)
+    pool = multiprocessing.Pool(workers)
+    pending = collections.deque()
+    try:
+        while True:
+            chunk = list(itertools.islice(urls, chunksize))
+            if chunk:
+                pending.append(pool.apply_async(_normalize_chunk,
+                                                ((chunk, charset),)))
+            if pending and (not chunk or len(pending) >= workers * 2):
+                for url in pending.popleft().get():
+                    yield url
+            if not chunk and not pending:
+                break
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def normalize_url_file(input, output, workers=None, chunksize=10000,
+                       charset='utf-8', verbose=False):
+    """Normalize the URLs read from 'input' (a filename or an iterable
+    of lines, one URL per line) writing them in the same order into
+    'output' (a filename or a file object) by using
+    normalize_urls_parallel(), without loading them all in memory.
+    If 'verbose' is True progress and throughput are printed on
+    stderr. Return a (count, elapsed, rate) tuple.
+    """
+    infile = outfile = None
+    if isinstance(input, basestring):
+        input = infile = open(input)
+    if isinstance(output, basestring):
+        output = outfile = open(output, 'w')
+    progress = ProgressReporter(interval=5, every=0)
+    count = 0
+    try:
+        urls = (line.rstrip('\r\n') for line in input)
+        for url in normalize_urls_parallel(urls, workers, chunksize, charset):
+            output.write(url + '\n')
+            count += 1
+            if verbose and progress.update(count):
+                sys.stderr.write("normalized %s urls, %0.0f urls/sec\n"
+                                 % (count, progress.rate or 0))
+    finally:
+        if infile is not None:
+            infile.close()
+        if outfile is not None:
+            outfile.close()
+    elapsed = time.time() - progress.started
+    rate = elapsed and count / elapsed or 0.0
+    if verbose:
+        sys.stderr.write("normalized %s urls in %0.3f secs, %0.0f urls/sec\n"
+                         % (count, elapsed, rate))
+    return count, elapsed, rate
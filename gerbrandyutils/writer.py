@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+##########################################################################
+# Copyright (C) 2009 - 2014 Huygens ING & Gerbrandy S.R.L.
+#
+# This file is part of bioport.
+#
+# bioport is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/gpl-3.0.html>.
+##########################################################################
+
+"""
+Background file writing, used by ScriptBase.write_file() when
+writer_threads is set.
+"""
+
+__all__ = ["AsyncWriter", "WriteError", "atomic_write"]
+
+import os
+import threading
+import Queue
+
+
+class WriteError(Exception):
+    """Raised in the caller's thread when a background write failed.
+    'filename' is the file which could not be written and 'error' the
+    original exception.
+    """
+
+    def __init__(self, filename, error):
+        Exception.__init__(self, "can't write %s: %s" % (filename, error))
+        self.filename = filename
+        self.error = error
+
+
+def atomic_write(filename, data, fsync=False):
+    """Write 'data' into a temporary file which is then renamed to
+    'filename', so that 'filename' is either complete or missing.
+    """
+    tmp = "%s.%s-%s.tmp" % (filename, os.getpid(),
+                            threading.current_thread().ident)
+    try:
+        f = open(tmp, 'wb')
+        try:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            f.close()
+        os.rename(tmp, filename)
+    except:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class AsyncWriter(object):
+    """Write files by using a pool of threads fed by a bounded queue:
+    write() only blocks when 'maxsize' files are already waiting to
+    be written.
+    Files are written atomically (see atomic_write()) and, if 'fsync'
+    is True, synced to disk before being renamed.
+
+    Errors are reported back to the caller as WriteError exceptions:
+    write() and drain() raise the first pending error, close() returns
+    all the pending ones; each error is reported once.
+    """
+
+    def __init__(self, threads=1, maxsize=1000, fsync=False):
+        self.fsync = fsync
+        self._queue = Queue.Queue(maxsize)
+        self._errors = []
+        self._threads = []
+        for i in range(threads):
+            t = threading.Thread(target=self._work)
+            t.setDaemon(True)
+            t.start()
+            self._threads.append(t)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                filename, data = item
+                try:
+                    atomic_write(filename, data, self.fsync)
+                except Exception, err:
+                    self._errors.append(WriteError(filename, err))
+            finally:
+                self._queue.task_done()
+
+    def check(self):
+        """Raise the first pending error, if any."""
+        if self._errors:
+            raise self._errors.pop(0)
+
+    def write(self, filename, data):
+        """Queue 'data' to be written into 'filename'."""
+        if not self._threads:
+            raise ValueError("writer is closed")
+        self.check()
+        self._queue.put((filename, data))
+
+    def drain(self):
+        """Wait until all the queued files have been written."""
+        self._queue.join()
+        self.check()
+
+    def close(self):
+        """Write all the queued files, stop the threads and return the
+        list of pending errors.
+        """
+        for t in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        errors, self._errors = self._errors, []
+        return errors